@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+# Benchmarks cronlib and the cronanalyzer analysis steps on a synthetic fleet.
+#
+# Generates hosts x crons cron resources with a configurable mix of schedules (see fleetgen.py),
+# times each step (best of --repeat runs), writes the results to a json file, and compares them
+# against a saved baseline. Exits non-zero if any step got slower than --threshold allows.
+#
+# usage: bench.py [options]
+#
+#   ./bench.py --save-baseline          (on the known-good version)
+#   ./bench.py                          (after your change; flags regressions)
+#
+import sys
+import os
+import time
+import random
+import platform
+import logging
+import simplejson as json
+from optparse import OptionParser
+import cronlib
+import fleetgen
+from cronanalyzer import analyzer, exporters
+from cronanalyzer.normalizer import cronify
+
+parser = OptionParser("usage: %prog [options]")
+parser.add_option("-d", "--debug", default=None, action="store_true", help="enable debug output")
+parser.add_option("--hosts", default=200, type="int", help="number of synthetic hosts (default: %default)")
+parser.add_option("--crons", default=20, type="int", help="crons per host (default: %default)")
+parser.add_option("--mix", default=fleetgen.default_mix,
+        help="schedule mix, as kind=weight pairs. kinds: %s (default: %%default)" % ', '.join(sorted(fleetgen.schedule_kinds)))
+parser.add_option("--days", default=7, type="int",
+        help="days of timestamps for expand_timestamps and ical (default: %default)")
+parser.add_option("--ical-hosts", default=5, type="int",
+        help="hosts to include in the ical benchmark (default: %default)")
+parser.add_option("--seed", default=42, type="int", help="random seed (default: %default)")
+parser.add_option("--repeat", default=3, type="int", help="runs per step, best is kept (default: %default)")
+parser.add_option("--output", default="bench-results.json", help="write results here (default: %default)")
+parser.add_option("--baseline", default="bench-baseline.json", help="compare against this (default: %default)")
+parser.add_option("--save-baseline", default=None, action="store_true", help="save the results as the new baseline")
+parser.add_option("--threshold", default=0.2, type="float",
+        help="flag a step as a regression if it's this much slower than baseline (default: %default)")
+(options, args) = parser.parse_args()
+
+# set up logging
+if options.debug: log_level = logging.DEBUG
+else:             log_level = logging.INFO
+
+logging.basicConfig(stream=sys.stdout, level=log_level)
+logging.basicConfig(stream=sys.stderr, level=(logging.ERROR,logging.CRITICAL))
+
+
+def synthetic_fleet(hosts, crons, mix, seed):
+    ''' returns {host: [puppet cron resource, ...]}, see fleetgen.py '''
+    r = random.Random(seed)
+    try:
+        kinds = fleetgen.parse_mix(mix)
+    except ValueError, e:
+        parser.error(str(e))
+
+    return dict((host, fleetgen.host_crons(r, crons, kinds)) for host in fleetgen.host_names(hosts))
+
+def timeit(name, func, results):
+    ''' runs func --repeat times, and records the best time in results '''
+    best = None
+    for i in xrange(options.repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best: best = elapsed
+    results[name] = best
+    logging.info("%-26s %10.4fs" % (name, best))
+
+def compare(results, baseline, threshold):
+    ''' prints a comparison with baseline, returns the list of steps that regressed '''
+    regressions = []
+    print "\n%-26s %10s %10s %8s" % ('step', 'baseline', 'now', 'change')
+    for name in sorted(results):
+        if name not in baseline:
+            print "%-26s %10s %9.4fs %8s" % (name, '-', results[name], 'new')
+            continue
+        change = (results[name] - baseline[name]) / baseline[name] if baseline[name] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print "%-26s %9.4fs %9.4fs %+7.1f%%%s" % (name, baseline[name], results[name], change * 100, flag)
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(args) > 0:
+        parser.error("this script doesn't take arguments, see --help")
+
+    config = {'hosts': options.hosts, 'crons': options.crons, 'mix': options.mix, 'days': options.days,
+              'ical_hosts': options.ical_hosts, 'seed': options.seed, 'repeat': options.repeat}
+    logging.info("benchmarking %(hosts)i hosts x %(crons)i crons, mix: %(mix)s, days: %(days)i" % config)
+
+    fleet = synthetic_fleet(options.hosts, options.crons, options.mix, options.seed)
+    lines = [cronify(cron) for crons in fleet.itervalues() for cron in crons]
+
+    # the same structures cron-analyze.py builds, used as input by the later steps:
+    all_data = {}
+    for host, crons in fleet.iteritems():
+        all_data[host] = dict((cronlib.normalize_entry(cronify(cron)), cron) for cron in crons)
+    schedules = set(cron[:5] for crons in all_data.itervalues() for cron in crons)
+    time_map  = dict((s, cronlib.expand_timestamps(s + ('',), days=options.days)) for s in schedules)
+    ical_data = sorted(all_data.iteritems())[:options.ical_hosts]
+
+    results = {}
+    timeit('normalize_entry', lambda: [cronlib.normalize_entry(line) for line in lines], results)
+    timeit('expand_timestamps', lambda: [cronlib.expand_timestamps(s + ('',), days=options.days) for s in schedules], results)
+    timeit('find_sameschedule_crons', lambda: [analyzer.find_sameschedule_crons(c) for c in all_data.itervalues()], results)
+
+    timeit('find_cron', lambda: analyzer.find_cron(all_data.iteritems(), '.*backup'), results)
+    timeit('ical', lambda: exporters.build_ical(ical_data, time_map).to_ical(), results)
+
+    report = {'config': config, 'results': results, 'python': platform.python_version(),
+              'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    json.dump(report, open(options.output, 'w'), indent=2, sort_keys=True)
+    logging.info("wrote %s" % options.output)
+
+    if options.save_baseline:
+        json.dump(report, open(options.baseline, 'w'), indent=2, sort_keys=True)
+        logging.info("saved baseline to %s" % options.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(options.baseline):
+        logging.info("no baseline at %s to compare against, use --save-baseline" % options.baseline)
+        sys.exit(0)
+
+    baseline = json.load(open(options.baseline))
+    if baseline['config'] != config:
+        logging.warn("baseline was run with a different config, comparison may be meaningless: %s" % baseline['config'])
+
+    regressions = compare(results, baseline['results'], options.threshold)
+    if regressions:
+        logging.error("%i step(s) regressed more than %i%%: %s" % (len(regressions), options.threshold * 100, ', '.join(regressions)))
+        sys.exit(1)
@@ -18,9 +18,11 @@
 # Some of these things may be normal and expected. To really parse your cron infrastructure,
 # the following are available:
 #   - ics (ical) output to view crons in a calendar application
+#   - svg timeline of a day or a week: how many crons start when, across all hosts and per host
 #   - regex searching all crons (displays cron lines per host, and summarizes which hosts it exists on)
+#   - an approximate summary for very large fleets, in fixed memory: the most common crons and commands,
+#     on how many hosts, and the busiest minutes of the day, with error bounds (see cronsketch.py)
 #
-# Future: Options for displaying {day,week}-at-a-time views of all crons that will run.
 # Future: for a given pair of crons (regex?), find out if they ever run at the same time.
 #
 # Note: you can run this with -e (use existing data) to run much faster, after the first time.
@@ -36,31 +38,66 @@ Use -e if you've already processed data once!
 import sys
 import os
 import re
+import time
 from datetime import datetime
-import subprocess
 import logging
-import simplejson as json
 from optparse import OptionParser
-import cronlib
-import cPickle as pickle
+import cronpack
+import cronarchive
+import cronmetrics
+from cronanalyzer import loader, normalizer, analyzer, exporters
+from cronanalyzer.normalizer import cronify
 
 parser = OptionParser("usage: %prog [options] OR, to analyze one file: [stdin] [input file]")
 parser.add_option("-d", "--debug", default=None, action="store_true", help="enable debug output")
 parser.add_option("--host", default=None, help="limit all actions to a specific host (puppet certname)")
 parser.add_option("-o", "--output", default=None,
-        help="default: stdout text-based summary. Options: [ical] (displays 5-minute events at the beginning of the year, for 7 days, unless -n is used)")
+        help="default: stdout text-based summary. Options: [ical] (displays 5-minute events at the beginning of the year, for 7 days, unless -n is used), [timeline] (writes timeline.svg: crons starting across all hosts, from --start, for 7 days unless -n is used)")
 parser.add_option("-n", "--num_days", default=None,
-        help="Number of days to generate timestamps for - defaults to 7 for ical output. Has no effect if used with -e.")
+        help="Number of days to generate timestamps for - defaults to 7 for ical, timeline output and --rebalance, 365 otherwise. With -e, only used by timeline output, --rebalance and --serve.")
+parser.add_option("--start", default=None, metavar="YYYY-MM-DD",
+        help="first day of the timeline (default: today), or of the days --serve looks for clashes in (default: January 1st)")
+parser.add_option("--width", default=1440, type="int",
+        help="width of the timeline in pixels, each pixel counts the crons starting in its share of the period (default: %default)")
+parser.add_option("--lanes", default=None, action="store_true",
+        help="add a swimlane per host to the timeline (use --host to pick hosts)")
 parser.add_option("-e", "--existing-data", default=None, action="store_true",
         help="skip the parse step, use existing data in ./analyze-output/")
 parser.add_option("-r", "-f", "--find", default=None, metavar="regex",
         help="finds a cron across all hosts by regex (searches command field) - use any python 're' compatible regex")
+parser.add_option("-a", "--archive", default=None, action="store_true",
+        help="read ./parse-output.pca and write ./analyze-output.pca (or read it, with -e), instead of one file per host")
+parser.add_option("--list-hosts", default=None, action="store_true", help="list all hosts with crons")
+parser.add_option("--at", default=None, metavar="'YYYY-MM-DD HH:MM'",
+        help="show crons that run at this time (local time), from their puppet schedule")
+parser.add_option("--rebalance", default=None, metavar="regex",
+        help="propose new minute/hour values for crons whose command matches regex, to lower the peak number of crons starting at once across all hosts (over -n days, default 7)")
+parser.add_option("--rebalance-tag", default=None, metavar="tag",
+        help="like --rebalance, for crons with this puppet tag (both may be used: crons must match both)")
+parser.add_option("--max-moves", default=None, type="int",
+        help="propose at most this many changes with --rebalance: stop lowering the peak before it'd take more (default: no limit)")
+parser.add_option("--approximate", default=None, action="store_true",
+        help="summarize the most common crons and commands, the distinct hosts they run on, and the busiest minutes of the day, using fixed-size sketches (reports their error bounds)")
+parser.add_option("--epsilon", default=0.0001, type="float",
+        help="--approximate counts may be too high by up to epsilon * crons counted (default: %default)")
+parser.add_option("--delta", default=0.01, type="float",
+        help="probability that an --approximate count is further off than that (default: %default)")
+parser.add_option("--hll-precision", default=10, type="int",
+        help="distinct hosts per command are counted in 2^N registers, standard error 1.04/sqrt(2^N) (default: %default)")
+parser.add_option("--top", default=10, type="int",
+        help="number of crons, commands and minutes --approximate shows (default: %default)")
+parser.add_option("--serve", default=None, action="store_true",
+        help="load existing data once, and answer queries from --socket clients until interrupted. Crons that clash are looked for over -n days (default: 365) from --start")
+parser.add_option("--socket", default=None, metavar="PATH",
+        help="unix socket to serve on (default: ./cron-analyze.sock) or, without --serve, to send this query to")
+parser.add_option("--profile", default=None, action="store_true",
+        help="profile the run with cProfile, print sorted stats to stderr and save them to ./metrics/")
+parser.add_option("--metrics", default=None, metavar="FILE",
+        help="write timings and counters as json to FILE (with just --profile: ./metrics/cron-analyze.json)")
 (options, args) = parser.parse_args()
 
-# conditional imports - things that may not exist on every system,
-#  and are only necessary if options are used:
-if options.output and 'ical' in options.output:
-    from icalendar import Calendar, Event
+# conditional imports - things that may not exist on every system, or are slow to import,
+#  and are only necessary if options are used, are done where they're used (see exporters.build_ical).
 
 # set up logging
 if options.debug: log_level = logging.DEBUG
@@ -69,107 +106,168 @@ else:             log_level = logging.INFO
 logging.basicConfig(stream=sys.stdout, level=log_level)
 logging.basicConfig(stream=sys.stderr, level=(logging.ERROR,logging.CRITICAL))
 
+cronmetrics.setup('cron-analyze', profile=options.profile, metrics_file=options.metrics)
 
-def cronify(cron):
-    ''' convert json puppet config back to actual cron entry line that'd appear on-disk '''
-    line = ""
-    params = cron['parameters']
-    if 'minute' in params:
-        if isinstance(params['minute'], list):
-            minute = ','.join(map(str, params['minute']))
-        else: minute = params['minute']
-        line += minute + ' '
-    else:
-        line += '* '
-
-    if 'hour' in params:
-        if isinstance(params['hour'], list):
-            hour = ','.join(map(str, params['hour']))
-        else: hour = params['hour']
-        line += hour + ' '
-    else:
-        line += '* '
-
-    if 'monthday' in params:
-        if isinstance(params['monthday'], list):
-            monthday = ','.join(map(str, params['monthday']))
-        else: monthday = params['monthday']
-        line += monthday + ' '
-    else:
-        line += '* '
-
-    if 'month' in params:
-        if isinstance(params['month'], list):
-            month = ','.join(map(str, params['month']))
-        else: month = params['month']
-        line += month + ' '
-    else:
-        line += '* '
 
-    if 'weekday' in params:
-        if isinstance(params['weekday'], list):
-            weekday = ','.join(map(str, params['weekday']))
-        else: weekday = params['weekday']
-        line += weekday + ' '
-    else:
-        line += '* '
-
-    if 'command' in params:
-        line += params['command'] + ' '
-    else:
-        # you can't have a cron with no command!
-        return None
-
-    return line
-
-def find_cron(all_crons, regex):
-    ''' finds crons across all hosts by searching regex '''
+def print_found(found, heading="Found on host %s: "):
+    ''' prints [(host, [cron lines])], from analyzer.find_cron or a cronquery.FleetIndex '''
 
     found_hosts = []
     found_sum   = 0
-    for host in all_crons.iteritems():
-        if options.host and host[0] not in options.host:
-            continue
-
-        found_crons = [v for k,v in host[1].iteritems() if re.match(regex, k[5]) ]
-
-        if len(found_crons) == 0: continue
-        found_sum += len(found_crons)
-
-        # re-construct how the cron looks on-disk, if any were found:
-        results = []
-        for cron in found_crons:
-            results.append(cronify(cron))
-        print "Found on host %s: " % host[0]
+    for host, results in found:
+        found_sum += len(results)
+        print heading % host
         print '\t', "\n\t".join(map(str, sorted(results)))
 
-        found_hosts.append(host[0])
+        found_hosts.append(host)
     if len(found_hosts) >0:
         print "\n\nSummary: found %i crons on the following %i hosts: \n%s" % (found_sum, len(found_hosts), '\n'.join(map(str, found_hosts)))
-    return
-
 
-def find_dups_allhosts(all_crons, time_map):
-    ''' the exact same cron running on various hosts (at the same times). returns dict {(host1, host2,): cron} '''
-    pass
+def print_overlap(found):
+    ''' prints [(host, [same schedule cron lines], [[cron line, cron line], ...])], from cronquery.FleetIndex.overlap '''
+
+    found_sum = 0
+    for host, sameschedule, sametime in found:
+        found_sum += len(sameschedule)
+        print "Found %i crons (in total), where some have the exact same run schedule on host %s: " % (len(sameschedule), host)
+        print '\t', "\n\t".join(map(str, sorted(sameschedule)))
+        if sametime:
+            print "Found %i pairs of crons with different schedules, that sometimes run at the same time on host %s: " % (len(sametime), host)
+            print '\t', "\n\t".join("%s\n\t  and: %s" % tuple(pair) for pair in sorted(sametime))
+
+    if len(found) >0:
+        print "\n\nSummary: found %i clashing crons within the following %i hosts: \n%s" % (found_sum, len(found), '\n'.join(host[0] for host in found))
+
+def rebalance(all_crons, days):
+    ''' proposes new run times for the crons selected by --rebalance/--rebalance-tag, and prints
+        them as puppet cron resources '''
+
+    def movable(host, cron):
+        if options.rebalance and not re.match(options.rebalance, cron['parameters'].get('command', '')):
+            return False
+        if options.rebalance_tag:
+            if 'tags' not in cron:
+                # compact records written before they kept tags: every cron would silently not match
+                logging.error("--rebalance-tag: crons on host %s have no tags. Compact parse-output written by an older "
+                              "cron-parse.py -c or puppetdb.py -c doesn't keep them; re-run it, or use json parse-output" % host)
+                sys.exit(1)
+            if options.rebalance_tag not in cron['tags']:
+                return False
+        return True
+
+    import cronbalance
+
+    with cronmetrics.timer('rebalance_load'):
+        jobs, load = cronbalance.build(all_crons, movable, days=days)
+    with cronmetrics.timer('rebalance'):
+        before, after, moved = cronbalance.rebalance(jobs, load, max_moves=options.max_moves)
+    cronmetrics.incr('movable_crons', len(jobs))
+    cronmetrics.incr('moved_crons', len(moved))
+
+    print "Peak number of crons starting in the same minute, over %i days: %i before, %i after moving %i of %i movable crons" % (
+        days, before, after, len(moved), len(jobs))
+
+    for job in sorted(moved, key=lambda j: (j.host, cronify(j.cron))):
+        params = job.proposed()
+        print "\n# %s: %s" % (job.host, cronify(job.cron))
+        print "cron { '%s':" % job.cron.get('title', params['command'])
+        for field in ('command', 'user', 'minute', 'hour', 'monthday', 'month', 'weekday'):
+            if field in params:
+                value = params[field]
+                if isinstance(value, list): value = ','.join(map(str, value))
+                print "    %-8s => '%s'," % (field, value)
+        print "}"
+
+def approximate(all_crons):
+    ''' prints analyzer.summarize_approximate's summary of all_crons, with its error bounds '''
+
+    if not 0 < options.epsilon < 1 or not 0 < options.delta < 1:
+        parser.error("--epsilon and --delta must be between 0 and 1")
+    if not 4 <= options.hll_precision <= 16:
+        parser.error("--hll-precision must be between 4 and 16")
+    if options.top < 1:
+        parser.error("--top must be at least 1")
+
+    with cronmetrics.timer('approximate'):
+        summary = analyzer.summarize_approximate(all_crons, options.epsilon, options.delta,
+                                                 options.hll_precision, options.top)
+    cronmetrics.incr('approximate_hosts', summary['hosts'])
+    cronmetrics.incr('approximate_crons', summary['crons'])
+    error = summary['error']
+
+    print "Approximate summary of %i crons on %i hosts" % (summary['crons'], summary['hosts'])
+    print "  count-min sketches: %i x %i counters, %i candidates; HyperLogLog: %i registers per cron and command" % (
+        error['width'], error['depth'], error['candidates'], error['registers'])
+    print "  counts are never too low, and are at most %.1f too high (epsilon %g), with probability %g" % (
+        error['duplicated'], error['epsilon'], 1 - error['delta'])
+    print "  distinct hosts are within +/-%.1f%% (one standard error)" % (100 * error['distinct'])
+    print "  for exact numbers, use the full analysis or --find"
+
+    print "\nMost common crons (crons: estimate, lowest possible; distinct hosts):"
+    for estimate, low, hosts, complete, line in summary['duplicated']:
+        if complete: print "\t%7i %7i %8i  %s" % (estimate, low, hosts, line)
+        else:        print "\t%7i %7i %7i+  %s" % (estimate, low, hosts, line)
+    if not all(cron[3] for cron in summary['duplicated']):
+        print "\t(+: the cron was seen before it was tracked, it may run on more hosts)"
+
+    print "\nMost common commands (crons: estimate, lowest possible; distinct hosts):"
+    for estimate, low, hosts, complete, command in summary['commands']:
+        if complete: print "\t%7i %7i %8i  %s" % (estimate, low, hosts, command)
+        else:        print "\t%7i %7i %7i+  %s" % (estimate, low, hosts, command)
+    if not all(command[3] for command in summary['commands']):
+        print "\t(+: the command was seen before it was tracked, it may run on more hosts)"
+
+    print "\nBusiest minutes of the day (crons starting, exact; ignores day, month and weekday):"
+    for crons, minute in summary['minutes']:
+        print "\t%s %7i" % (minute, crons)
+
+def parse_time(when):
+    ''' 'YYYY-MM-DD HH:MM' (local time) -> timestamp '''
+    try:
+        return time.mktime(time.strptime(when, '%Y-%m-%d %H:%M'))
+    except ValueError:
+        parser.error("--at takes a local time like '2012-04-01 03:00', not: %s" % when)
+
+def parse_day(day):
+    ''' 'YYYY-MM-DD' -> datetime.date '''
+    try:
+        return datetime.strptime(day, '%Y-%m-%d').date()
+    except ValueError:
+        parser.error("--start takes a day like '2012-04-01', not: %s" % day)
+
+def query_daemon(path):
+    ''' sends the question asked on the command line to a --serve daemon on path, and prints the answer '''
+
+    if options.output or options.rebalance or options.rebalance_tag or options.approximate:
+        parser.error("-o, --rebalance and --approximate can't be used with --socket, run without it")
+
+    import cronquery
 
-def find_sametime_crons(crons, time_map):
-    ''' any crons that *ever* run at the same time on a host. returns list of full (puppet) crons. '''
-    #TODO
-    #return [v for k,v in cron.iteritems() if time_map[k[:5]] in
-    pass
+    if options.find:
+        found = cronquery.query(path, {'op': 'find', 'regex': options.find, 'host': options.host})
+        print_found(found)
+    elif options.list_hosts:
+        print '\n'.join(cronquery.query(path, {'op': 'hosts', 'host': options.host}))
+    elif options.at:
+        found = cronquery.query(path, {'op': 'at', 'timestamp': parse_time(options.at), 'host': options.host})
+        print_found(found, "Running at %s on host %%s: " % options.at)
+    else:
+        print_overlap(cronquery.query(path, {'op': 'overlap', 'host': options.host}))
 
-def find_sameschedule_crons(crons):
-    ''' crons that run at the same schedule on a host. returns list of full (puppet) crons. '''
 
-    # ok, I better document this fucker.
-    #
-    # the nested comprehension just returns the time part of the key, for comparison (but skips if its
-    #  full key matches the outer loop's full key)
-    # loops over all crons, and compares the time part of the key (0,*,*,*,*),
-    #  to all other keys (skipping itself).. then returns list of values (puppet cron json) that match.
+def print_processed(catalogs, time_map, days):
+    ''' like normalizer.process_catalogs, but prints each host's normalized crons (and time_map)
+        instead of writing them out '''
+    for host, crons in catalogs:
+        cronmetrics.incr('hosts')
+        cronmetrics.incr('crons', len(crons))
 
-    return [v for k,v in crons.iteritems() if k[:5] in [i[:5] for i,j in crons.iteritems() if i != k ] ]
+        output = normalizer.normalize_crons(host, crons, time_map, days)
+        if output:
+            print {host: output}, time_map
+            yield host, output
+        else:
+            print output, time_map
 
 
 if __name__ == '__main__':
@@ -177,122 +275,127 @@ if __name__ == '__main__':
     indir  = './parse-output/'
     outdir = './analyze-output/'
 
-    if not os.path.exists(outdir): os.makedirs(outdir)
+    if not os.path.exists(outdir) and not options.archive: os.makedirs(outdir)
 
     if len(args) > 1:
         parser.error("only one argument allowed: file to read from")
 
+    # thin client: a --serve daemon already has everything loaded, just ask it.
+    if options.socket and not options.serve:
+        import socket
+        try:
+            query_daemon(options.socket)
+        except (socket.error, RuntimeError), e:
+            logging.error("query to %s failed: %s" % (options.socket, e))
+            sys.exit(1)
+        sys.exit(0)
+
+    # the daemon answers from existing data
+    if options.serve:
+        options.existing_data = True
+
     ''' First, find the cron json list  - stdin, a file arg, or dirlist() '''
     stdin = None
     if not sys.stdin.isatty(): # redirected from file or pipe
         stdin = sys.stdin.read()
 
-    crons    = []
-    catalogs = {}
-
-    if stdin:
-        crons = json.loads(stdin)
-        catalogs.update({'single':crons})
+    # catalogs is a generator of (host, crons): nothing is read until a host is processed.
+    if stdin and stdin.startswith(cronpack.MAGIC):
+        catalogs = iter([('single', cronpack.loads(stdin)[1])])
+    elif stdin:
+        import simplejson as json
+        catalogs = iter([('single', json.loads(stdin))])
     elif len(args) == 1:
-        for cron in open(args[0], "r").readlines():
-            crons += json.loads(cron)
-        catalogs.update({os.path.basename(args[0]):crons})
+        catalogs = ((host, loader.load_crons(args[0])) for host in [os.path.basename(args[0])]
+                    if loader.wanted_host(host, options.host))
+    elif options.archive and not options.existing_data:
+        catalogs = loader.iter_catalogs(cronarchive.Archive(indir.rstrip('/') + '.pca'), options.host)
     else:
-        for catalog in os.listdir(indir):
-            crons = []
-            for cron in open(indir + catalog, "r").readlines():
-                crons += json.loads(cron)
-            catalogs.update({catalog:crons})
+        catalogs = loader.iter_catalogs(indir, options.host)
 
     ''' Next, for every catalog/blob, convert to dicts for processing: '''
 
+    # all_data is a generator of (host, {norm_cron: cron}), consumed once by whichever job runs below.
+    # time_map is only read from existing data by the jobs that need times (see need_time_map).
     if not options.existing_data:
-        all_data = {}
-        for filename,crons in catalogs.iteritems():
-            if options.host and filename not in options.host:
-                continue
-
-            # create a list crons that actually run (i.e. skips ensure=>absent)
-            live_crons = []
-
-            for cron in crons:
-                if 'ensure' in cron['parameters'] and cron['parameters']['ensure'] == 'absent':
-                   continue
-                else:
-                    # these crons will actually run, ignore others:
-                    live_crons.append(cron)
-
-            #
-            # Using cronlib, we'll genreate a list of timestamps all crons will run at..
-            # Stores every non-duplicate cron time('0 * * * *') list of timestamps in time_map.
-            # where the key is the cron entry (normalized as a tuple), and the value is a list of timestamps.
-            # Dumps to pickle files, for subsequent runs where --existing-data may be used.
-            #
-
-            output = {}
-            # output: {"hostname": {"(0, 0, 1, 1, 0, 'command')": PUPPET_JSON, "(0,...)": PUPPET_JSON, ... }
-            time_map = {}
-            # time_map: {"(0, 0, 1, 1, 0)": [98742323423.0, 29482039423.0, ... ]}
-
-            if not options.num_days and (options.output and 'ical' in options.output):
-                days = 7
-            elif not options.num_days:
-                days = 365
-            else: days = int(options.num_days)
-
-            for cron in live_crons:
-                if options.debug: logging.debug("processing host: %s and cron: %s" % (filename, cron))
-                _cron = cronify(cron)
-
-                if _cron is None:
-                    continue
-
-                norm_cron = cronlib.normalize_entry(_cron)
-
-                if norm_cron and norm_cron[:5] not in time_map:
-                    timestamps = cronlib.expand_timestamps(norm_cron, days=days)
-                    time_map.update({norm_cron[:5]:timestamps})
-
-                if filename in output and norm_cron in output[filename]:
-                    logging.warn("Found duplicate cron job on host %s. Skipping all but one: \n\t%s" % (filename, _cron))
-
-                if not filename in output:
-                    output.update({filename:{norm_cron:cron}})
-                else:
-                    output[filename].update({norm_cron:cron})
-
-            # Write to file:
-            if stdin:
-                print output, time_map
-            elif len(args) == 1:
-                pickle.dump(output, open(outdir + filename, 'w'))
-                pickle.dump(time_map, open(outdir + "time_map.pickle", 'w'))
+        if not options.num_days and (options.output and ('ical' in options.output or 'timeline' in options.output)):
+            days = 7
+        elif not options.num_days:
+            days = 365
+        else: days = int(options.num_days)
+
+        time_map = {}
+        if stdin:
+            all_data = print_processed(catalogs, time_map, days)
+        elif options.approximate:
+            # nothing's expanded or written: one host's crons are in memory at a time
+            all_data = ((host, output) for host, output in
+                        ((host, normalizer.normalize_crons(host, crons, None)) for host, crons in catalogs)
+                        if output)
+        else:
+            # a partial run (--host, or a single file) adds to the existing analysis; the last write wins.
+            append = bool(options.host or len(args) == 1)
+            if options.archive:
+                if append: out = cronarchive.Archive(outdir.rstrip('/') + '.pca', 'a')
+                else:      out = cronarchive.Archive(outdir.rstrip('/') + '.pca', 'w')
             else:
-                pickle.dump(output, open(outdir + filename, 'w'))
-                pickle.dump(time_map, open(outdir + "time_map.pickle", 'w'))
-
-            # add to all_data
-            all_data.update(output)
-        # end loop: every file in indir
+                out = outdir
+            all_data = normalizer.process_catalogs(catalogs, time_map, days, out, append)
 
-    ''' Next, analyze. Read all files (if we've skipped the analyze step) and analyze. '''
+    ''' Or, if we've skipped the analyze step, read existing analysis files one host at a time. '''
 
     if options.existing_data:
-        all_data = {}
-        indir = outdir
-        for host in os.listdir(indir):
-            if options.host and host not in options.host:
-                continue
-            if host != 'time_map.pickle':
-                data = pickle.load(open(indir + host, 'r'))
-                all_data.update(data)
-        time_map = pickle.load(open(indir + "time_map.pickle", 'r'))
+        if options.archive:
+            source = cronarchive.Archive(outdir.rstrip('/') + '.pca')
+        else:
+            source = outdir
+        all_data = loader.iter_analyzed(source, options.host)
+
+    def need_time_map():
+        ''' time_map, read from existing data the first time it's needed '''
+        if options.existing_data:
+            return loader.load_time_map(source)
+        return time_map
+
+    def fleet_index():
+        ''' a cronquery.FleetIndex of all_data, for -n days from --start '''
+        import cronquery
+        if options.start: start = parse_day(options.start)
+        else:             start = None
+        with cronmetrics.timer('index'):
+            return cronquery.FleetIndex(all_data, cronify, int(options.num_days or 365), start)
 
     ''' jobs that just run, and terminate '''
 
+    # load everything once, and answer --socket clients:
+    if options.serve:
+        import cronquery
+        cronquery.serve(fleet_index(), options.socket or './cron-analyze.sock')
+        sys.exit(0)
+
+    # host listing, and crons running at a point in time:
+    if options.list_hosts:
+        print '\n'.join(sorted(host for host, crons in all_data))
+        sys.exit(0)
+    if options.at:
+        print_found(fleet_index().at(parse_time(options.at), options.host), "Running at %s on host %%s: " % options.at)
+        sys.exit(0)
+
     # if we're just searching all crons, do it and exit:
     if options.find:
-        find_cron(all_data, options.find)
+        with cronmetrics.timer('find'):
+            print_found(analyzer.find_cron(all_data, options.find, options.host))
+        sys.exit(0)
+
+    # fixed-memory summary of a very large fleet:
+    if options.approximate:
+        approximate(all_data)
+        sys.exit(0)
+
+    # propose a better schedule for some crons:
+    if options.rebalance or options.rebalance_tag:
+        if options.num_days: rebalance(all_data, int(options.num_days))
+        else:                rebalance(all_data, 7)
         sys.exit(0)
 
     #
@@ -300,42 +403,37 @@ if __name__ == '__main__':
     #
     # ical output
     if options.output and 'ical' in options.output :
-        cal = Calendar()
-        cal.add('prodid', '-//Cron calendar//mxm.dk//')
-        cal.add('version', '2.0')
-
-        for host in all_data.iteritems():
-            if options.host and host not in options.host:
-                continue
-            for cron in host[1]:
-                for timestamp in time_map[cron[:5]]:
-                    event = Event()
-                    event.add('summary', "%s: %s" % (host[0], cron[5:]))
-                    event.add('dtstart', datetime.fromtimestamp(timestamp))
-                    event.add('dtend',   datetime.fromtimestamp(timestamp+300))
-                    #event.add('dtstamp', datetime.fromtimestamp(timestamp,tzinfo=UTC))
-                    #event['uid'] = '20050115T101010/27346262376@mxm.dk'
-                    #event.add('priority', 1)
-
-                    cal.add_component(event)
-
-        f = open('crons.ics', 'wb')
-        f.write(cal.to_ical())
-        f.close()
+        with cronmetrics.timer('ical'):
+            exporters.write_ical(all_data, need_time_map(), 'crons.ics')
+        sys.exit(0)
+
+    # timeline output
+    if options.output and 'timeline' in options.output:
+        if options.start: start = parse_day(options.start)
+        else:             start = None
+        if options.width < 1:
+            parser.error("--width must be at least 1")
+
+        with cronmetrics.timer('timeline'):
+            exporters.write_timeline(all_data, 'timeline.svg', start, int(options.num_days or 7), options.width,
+                                     lanes=options.lanes)
         sys.exit(0)
 
 
     ''' full analysis '''
     #
-    # find any crons that run on the exact same schedule on a host:
+    # for each host, in one pass over all_data:
     #
+    time_map    = need_time_map()
     found_hosts = []
     found_sum   = 0
-    for host in all_data.iteritems():
-        if options.host and host[0] not in options.host:
-            continue
+    for host in all_data:
+        #
+        # find any crons that run on the exact same schedule on a host:
+        #
         results = []
-        found_crons = find_sameschedule_crons(host[1])
+        with cronmetrics.timer('sameschedule'):
+            found_crons = analyzer.find_sameschedule_crons(host[1])
         found_sum += len(found_crons)
 
         for cron in found_crons:
@@ -346,22 +444,14 @@ if __name__ == '__main__':
 
         found_hosts.append(host[0])
 
+        #
+        # find any crons that ever run at the same time, on the same host:
+        #
+        analyzer.find_sametime_crons(host[1], time_map)
+
     if len(found_hosts) >0:
         print "\n\nSummary: found %i clashing crons within the following %i hosts: \n%s" % (found_sum, len(found_hosts), '\n'.join(map(str, found_hosts)))
 
-    #
-    # find any crons that ever run at the same time, on the same host:
-    #
-    found_hosts = []
-    found_sum   = 0
-    for host in all_data.iteritems():
-        if options.host and host[0] not in options.host:
-            continue
-        find_sametime_crons(host[1], time_map)
-
-        for cron in found_crons:
-            results.append(cronify(cron))
-
 
 #    hourly = [r for r in live_crons
 #            if r['parameters']['hour'] == '*']
@@ -372,7 +462,3 @@ if __name__ == '__main__':
 
 
     ''' Finally, write out results and/or print summary '''
-
-
-
-
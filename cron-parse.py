@@ -8,21 +8,34 @@
 #  digestion by cron-analyze. The [input file] (or stdin) is expected to be a puppet
 #  catalog in json format (see `puppet master --compile`).
 #
-# usage: cron-parse.py [--console]
+# usage: cron-parse.py [--console] [--compact]
 #
 # With no command line options, this will parse all crons in ./catalogs/ and output to ./parse-output/.
 # If stdin is provided, it will output the result to stdout.
+# With --compact, output is written as compact binary records (see cronpack.py) instead of json.
+# With --archive, ./catalogs.pca is read and ./parse-output.pca is written (see cronarchive.py).
 #
 
 import sys, os, logging
-import simplejson as json
 from optparse import OptionParser
+import cronpack
+import cronarchive
+import cronmetrics
+from cronanalyzer.loader import load_catalog, extract_crons, clean_catalog, format_crons
 
 # parse arguments
 parser = OptionParser("usage: %prog [options]")
 parser.add_option("--console", default=False, action="store_true", help="output to stdout")
 parser.add_option("-d", "--debug", default=None, action="store_true", help="enable debug output")
 parser.add_option("-g", "--generate", default=None, help="run puppet master --compile to generate json catalogs")
+parser.add_option("-c", "--compact", default=False, action="store_true",
+        help="write compact binary records (host, schedule, command, user, ensure) instead of the full json")
+parser.add_option("-a", "--archive", default=False, action="store_true",
+        help="read ./catalogs.pca and write ./parse-output.pca, instead of one file per host")
+parser.add_option("--profile", default=None, action="store_true",
+        help="profile the run with cProfile, print sorted stats to stderr and save them to ./metrics/")
+parser.add_option("--metrics", default=None, metavar="FILE",
+        help="write timings and counters as json to FILE (with just --profile: ./metrics/cron-parse.json)")
 (options, args) = parser.parse_args()
 
 # set up logging
@@ -33,34 +46,42 @@ else:             log_level = logging.INFO
 logging.basicConfig(stream=sys.stdout, level=log_level)
 logging.basicConfig(stream=sys.stderr, level=(logging.ERROR,logging.CRITICAL))
 
+cronmetrics.setup('cron-parse', profile=options.profile, metrics_file=options.metrics)
 
-def extract_crons(puppet_catalog):
-    """ returns a list of dicts, and each dict contains the entire puppet resource for a cron """
-    crons = []
-    for resource in puppet_catalog['data']['resources']:
-        for key, value in resource.iteritems():
-            if key == 'type' and value == 'Cron':
-                crons.append(resource)
-    return crons
 
 def do_parse_and_write(catalogs_dir, outdir):
     for catalog in os.listdir(catalogs_dir):
         if options.debug: logging.debug("parsing %s" % catalog)
 
         # parse crons out of catalog
-        crons = extract_crons(json.load(open(catalogs_dir + catalog)))
+        crons = extract_crons(load_catalog(open(catalogs_dir + catalog).read()))
+        data  = format_crons(catalog, crons, options.compact)
 
-        # write json of just crons
-        FILE = open(outdir + catalog, 'w')
-        print >>FILE, json.dumps(crons)
-        FILE.close()
+        with cronmetrics.timer('write'):
+            FILE = open(outdir + catalog, 'wb')
+            FILE.write(data)
+            FILE.close()
+    return True
+
+def do_parse_and_write_archive(catalogs, output):
+    ''' same as do_parse_and_write, between two cronarchive.Archives '''
+    for catalog in catalogs.hosts():
+        if options.debug: logging.debug("parsing %s" % catalog)
+
+        with cronmetrics.timer('clean'):
+            data = clean_catalog(catalogs.read(catalog))
+        crons = extract_crons(load_catalog(data))
+        data  = format_crons(catalog, crons, options.compact)
+
+        with cronmetrics.timer('write'):
+            output.write(catalog, data)
     return True
 
 if __name__ == '__main__':
     outdir = './parse-output/'
     input_dir = './catalogs/'
 
-    if not os.path.exists(outdir): os.makedirs(outdir)
+    if not os.path.exists(outdir) and not options.archive: os.makedirs(outdir)
 
     stdin = None
     if not sys.stdin.isatty(): # redirected from file or pipe
@@ -70,26 +91,37 @@ if __name__ == '__main__':
     crons = []
 
     if stdin:
-        crons = extract_crons(json.loads(stdin))
+        crons = extract_crons(load_catalog(stdin))
+    elif options.archive:
+        # catalogs are cleaned as they're read, rather than rewritten in place
+        catalogs = cronarchive.Archive(input_dir.rstrip('/') + '.pca')
+        output   = cronarchive.Archive(outdir.rstrip('/') + '.pca', 'w')
+        do_parse_and_write_archive(catalogs, output)
+        catalogs.close()
+        output.close()
     else:
         # if generated by puppet.py, could have garbage at the top. rewrite:
-        for catalog in os.listdir(input_dir):
-            if options.debug: logging.debug("rewriting catalog for: %s" % catalog)
-            newcatalog = []
-            catalogfile = open(input_dir + catalog, 'r')
-            for line in catalogfile.readlines():
-                if '36mnotice:' in line or '33mwarning:' in line: continue
-                else: newcatalog.append(line.rstrip('\n'))
-            catalogfile.close()
-
-            catalogfile = open(input_dir + catalog, 'w')
-            for line in newcatalog:
-                print >>catalogfile, line
-            catalogfile.close()
+        with cronmetrics.timer('clean'):
+            for catalog in os.listdir(input_dir):
+                if options.debug: logging.debug("rewriting catalog for: %s" % catalog)
+                newcatalog = []
+                catalogfile = open(input_dir + catalog, 'r')
+                for line in catalogfile.readlines():
+                    if '36mnotice:' in line or '33mwarning:' in line: continue
+                    else: newcatalog.append(line.rstrip('\n'))
+                catalogfile.close()
+
+                catalogfile = open(input_dir + catalog, 'w')
+                for line in newcatalog:
+                    print >>catalogfile, line
+                catalogfile.close()
 
         do_parse_and_write(input_dir, outdir)
 
-    if stdin:
+    if stdin and options.compact:
+        cronpack.dump('single', crons, sys.stdout)
+    elif stdin:
+        import simplejson as json
         print json.dumps(crons)
 
 
@@ -0,0 +1,20 @@
+### -*- coding: utf-8 -*-
+# the cron analysis pipeline, importable: the scripts are command line front-ends to this
+#
+#   loader      reads and writes catalogs, parse-output and analyze-output (directories or archives)
+#   normalizer  puppet cron resources -> {norm_cron: cron} per host, and the times they run at
+#   analyzer    searches and clash detection over normalized crons
+#   exporters   ical and svg timeline output
+#
+# Importing any of these has no side effects: nothing parses sys.argv, configures logging or
+# writes metrics, and modules that are slow to import (simplejson, icalendar, ...) are only
+# imported by the functions that need them. Functions take what they need (e.g. host, days)
+# as arguments and return results, so a monitoring check can import this and ask a question
+# without paying for a script's startup.
+#
+# Usage:
+'''
+from cronanalyzer import loader, analyzer
+for host, lines in analyzer.find_cron(loader.iter_analyzed('./analyze-output/'), '.*backup'):
+    print host, lines
+'''
@@ -0,0 +1,63 @@
+### -*- coding: utf-8 -*-
+# questions about normalized crons: where does a cron run, which crons clash on a host,
+# and (approximately, for very large fleets) which crons and minutes are the most common
+#
+# all_crons is an iterable of (host, {norm_cron: cron}), as normalizer.process_catalogs or
+# loader.iter_analyzed yield them. Results are returned, not printed (see exporters).
+#
+# Usage:
+'''
+from cronanalyzer import loader, analyzer
+found = analyzer.find_cron(loader.iter_analyzed('./analyze-output/'), '.*backup')
+'''
+
+import re
+from cronanalyzer.normalizer import cronify
+
+
+def find_cron(all_crons, regex, host=None):
+    ''' finds crons across all hosts by searching regex (matched against the command).
+        returns [(host, [cron lines])], limited by host like --host '''
+
+    found = []
+    for name, crons in all_crons:
+        if host and name not in host:
+            continue
+
+        found_crons = [v for k,v in crons.iteritems() if re.match(regex, k[5]) ]
+
+        if len(found_crons) == 0: continue
+
+        # re-construct how the cron looks on-disk, if any were found:
+        found.append((name, [cronify(cron) for cron in found_crons]))
+
+    return found
+
+def summarize_approximate(all_crons, epsilon=0.0001, delta=0.01, precision=10, top=10):
+    ''' the most common crons and commands (and on how many distinct hosts), and the busiest minutes
+        of the day, with their error bounds, in fixed memory however many hosts there are.
+        See cronsketch.summarize. '''
+    import cronsketch
+    return cronsketch.summarize(all_crons, cronify, epsilon, delta, precision, top)
+
+def find_dups_allhosts(all_crons, time_map):
+    ''' the exact same cron running on various hosts (at the same times). returns dict {(host1, host2,): cron} '''
+    pass
+
+def find_sametime_crons(crons, time_map):
+    ''' any crons that *ever* run at the same time on a host. returns list of full (puppet) crons. '''
+    #TODO
+    #return [v for k,v in cron.iteritems() if time_map[k[:5]] in
+    pass
+
+def find_sameschedule_crons(crons):
+    ''' crons that run at the same schedule on a host. returns list of full (puppet) crons. '''
+
+    # ok, I better document this fucker.
+    #
+    # the nested comprehension just returns the time part of the key, for comparison (but skips if its
+    #  full key matches the outer loop's full key)
+    # loops over all crons, and compares the time part of the key (0,*,*,*,*),
+    #  to all other keys (skipping itself).. then returns list of values (puppet cron json) that match.
+
+    return [v for k,v in crons.iteritems() if k[:5] in [i[:5] for i,j in crons.iteritems() if i != k ] ]
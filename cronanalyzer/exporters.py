@@ -0,0 +1,66 @@
+### -*- coding: utf-8 -*-
+# output formats for viewing crons elsewhere: ical (calendar apps) and svg timelines
+#
+# Both need modules that are slow to import (icalendar) or only used here, so they're
+# imported when an export is made, not when this module is.
+#
+# Usage:
+'''
+from cronanalyzer import loader, exporters
+source = './analyze-output/'
+exporters.write_ical(loader.iter_analyzed(source), loader.load_time_map(source), 'crons.ics')
+exporters.write_timeline(loader.iter_analyzed(source), 'timeline.svg', days=1)
+'''
+
+from datetime import datetime, date, timedelta
+import cronmetrics
+
+
+def build_ical(all_crons, time_map):
+    ''' returns an icalendar Calendar with a 5-minute event for every time every cron runs.
+        all_crons is an iterable of (host, {norm_cron: cron}) '''
+    from icalendar import Calendar, Event
+
+    cal = Calendar()
+    cal.add('prodid', '-//Cron calendar//mxm.dk//')
+    cal.add('version', '2.0')
+
+    # timestamps are converted to datetimes once per schedule, not once per host and cron
+    datetimes = {}
+    duration  = timedelta(minutes=5)
+
+    for host in all_crons:
+        for cron in host[1]:
+            if cron[:5] not in datetimes:
+                datetimes[cron[:5]] = [datetime.fromtimestamp(timestamp) for timestamp in time_map[cron[:5]]]
+
+            for start in datetimes[cron[:5]]:
+                event = Event()
+                event.add('summary', "%s: %s" % (host[0], cron[5:]))
+                event.add('dtstart', start)
+                event.add('dtend',   start + duration)
+                #event.add('dtstamp', datetime.fromtimestamp(timestamp,tzinfo=UTC))
+                #event['uid'] = '20050115T101010/27346262376@mxm.dk'
+                #event.add('priority', 1)
+
+                cal.add_component(event)
+                cronmetrics.incr('ical_events')
+
+    return cal
+
+def write_ical(all_crons, time_map, filename='crons.ics'):
+    ''' writes build_ical's calendar to filename '''
+    cal = build_ical(all_crons, time_map)
+
+    f = open(filename, 'wb')
+    f.write(cal.to_ical())
+    f.close()
+
+def write_timeline(all_crons, filename='timeline.svg', start=None, days=7, width=1440, lanes=False):
+    ''' writes an svg timeline of all_crons from start (a datetime.date, default: today) for days
+        days, width pixels wide, to filename. See crontimeline. '''
+    import crontimeline
+
+    if start is None:
+        start = date.today()
+    crontimeline.Timeline(start, days, width).render(all_crons, filename, lanes=lanes)
@@ -0,0 +1,160 @@
+### -*- coding: utf-8 -*-
+# reading and writing the files each stage leaves behind
+#
+#   catalogs:      puppet catalog json, from puppet.py or fleetgen.py (see load_catalog, extract_crons)
+#   parse-output:  one host's crons as json lists, or compact records (see parse_crons, format_crons)
+#   analyze-output: pickled {host: {norm_cron: cron}} per host, plus time_map.pickle (see iter_analyzed)
+#
+# Every source is either a directory (ending in '/') or a cronarchive.Archive. host limits which
+# hosts are read, the same way cron-analyze.py --host does: a host is read if its name is in host.
+#
+# Usage:
+'''
+from cronanalyzer import loader
+for host, crons in loader.iter_catalogs('./parse-output/'):
+    print host, len(crons)
+'''
+
+import os
+import cPickle as pickle
+import cronpack
+import cronarchive
+import cronmetrics
+
+
+def wanted_host(name, host=None):
+    ''' True unless host is given and excludes name '''
+    return not host or name in host
+
+def archive_hosts(archive, host=None):
+    ''' hosts in a cronarchive.Archive, limited by host. An exact host is just an index lookup. '''
+    if host and host in archive:
+        return [host]
+    return [name for name in archive.hosts() if wanted_host(name, host)]
+
+def clean_catalog(catalog):
+    ''' drops the notice/warning lines puppet.py can leave at the top of a catalog '''
+    return '\n'.join([line for line in catalog.split('\n')
+                      if not ('36mnotice:' in line or '33mwarning:' in line)])
+
+def load_catalog(data):
+    ''' parses one catalog's json '''
+    import simplejson as json
+
+    cronmetrics.incr('hosts')
+    cronmetrics.incr('bytes_read', len(data))
+    with cronmetrics.timer('json_load'):
+        return json.loads(data)
+
+def extract_crons(puppet_catalog):
+    ''' returns a list of dicts, and each dict contains the entire puppet resource for a cron '''
+    crons = []
+    with cronmetrics.timer('extract'):
+        for resource in puppet_catalog['data']['resources']:
+            for key, value in resource.iteritems():
+                if key == 'type' and value == 'Cron':
+                    crons.append(resource)
+    cronmetrics.incr('crons', len(crons))
+    return crons
+
+def format_crons(host, crons, compact=False):
+    ''' returns json of just crons, or compact records, as parse-output holds them '''
+    import simplejson as json
+
+    with cronmetrics.timer('format'):
+        if compact:
+            data = cronpack.dumps(host, crons)
+        else:
+            data = json.dumps(crons) + '\n'
+    cronmetrics.incr('bytes_written', len(data))
+    return data
+
+def parse_crons(data):
+    ''' returns the list of crons in one host's cron json (a json list per line).
+        Compact records written by cron-parse.py --compact are read directly, skipping json. '''
+    cronmetrics.incr('bytes_read', len(data))
+
+    if data.startswith(cronpack.MAGIC):
+        with cronmetrics.timer('load_compact'):
+            return cronpack.loads(data)[1]
+
+    import simplejson as json
+
+    crons = []
+    with cronmetrics.timer('load_json'):
+        for line in data.splitlines():
+            if line.strip():
+                crons += json.loads(line)
+    return crons
+
+def load_crons(filename):
+    ''' reads one host's crons from filename (see parse_crons) '''
+    FILE = open(filename, 'rb')
+    crons = parse_crons(FILE.read())
+    FILE.close()
+    return crons
+
+def iter_catalogs(source, host=None):
+    ''' lazily yields (host, crons) for every host in source, a directory or a cronarchive.Archive.
+        Hosts excluded by host are skipped before their file is opened (or their blob is read),
+        so only one host's crons are in memory at a time. '''
+    if isinstance(source, cronarchive.Archive):
+        for catalog in archive_hosts(source, host):
+            yield catalog, parse_crons(source.read(catalog))
+        return
+
+    for catalog in os.listdir(source):
+        if not wanted_host(catalog, host):
+            continue
+        yield catalog, load_crons(source + catalog)
+
+def iter_analyzed(source, host=None):
+    ''' lazily yields (host, {norm_cron: cron}) from the pickles in source, a directory or
+        a cronarchive.Archive (see cron-analyze.py --existing-data) '''
+    if isinstance(source, cronarchive.Archive):
+        hosts = archive_hosts(source, host)
+    else:
+        hosts = [name for name in os.listdir(source) if wanted_host(name, host)]
+
+    for name in hosts:
+        if name == 'time_map.pickle':
+            continue
+        data = load_output(source, name)
+        cronmetrics.incr('hosts', len(data))
+        for item in data.iteritems():
+            yield item
+
+def load_output(source, name):
+    ''' unpickles name from source, a directory or a cronarchive.Archive '''
+    if isinstance(source, cronarchive.Archive):
+        data = source.read(name)
+    else:
+        data = open(source + name, 'r').read()
+
+    cronmetrics.incr('bytes_read', len(data))
+    with cronmetrics.timer('unpickle'):
+        return pickle.loads(data)
+
+def has_output(source, name):
+    ''' True if source, a directory or a cronarchive.Archive, holds name '''
+    if isinstance(source, cronarchive.Archive):
+        return name in source
+    return os.path.exists(source + name)
+
+def load_time_map(source):
+    ''' returns time_map ({schedule: [timestamps]}) from source. It holds every distinct schedule's
+        timestamps for the whole period analyzed, so only load it when times are needed. '''
+    return load_output(source, 'time_map.pickle')
+
+def write_output(out, name, obj):
+    ''' pickles obj as name to out, a directory or a cronarchive.Archive '''
+    with cronmetrics.timer('pickle'):
+        data = pickle.dumps(obj)
+    cronmetrics.incr('bytes_written', len(data))
+
+    if isinstance(out, cronarchive.Archive):
+        out.write(name, data)
+    else:
+        FILE = open(out + name, 'w')
+        FILE.write(data)
+        FILE.close()
@@ -0,0 +1,207 @@
+### -*- coding: utf-8 -*-
+# turns puppet cron resources into normalized crons, and the times they run at
+#
+# A host's crons become {norm_cron: cron}: norm_cron is cronlib.normalize_entry's 6-tuple
+# (minute, hour, monthday, month, weekday, command), and cron is the puppet resource.
+# crons with ensure => absent are dropped, and a cron that's on a host twice is kept once.
+#
+# time_map holds the timestamps each distinct schedule (norm_cron[:5]) runs at. Every
+# schedule is only expanded once, however many crons and hosts share it.
+#
+# Usage:
+'''
+from cronanalyzer import loader, normalizer
+time_map = {}
+for host, crons in normalizer.process_catalogs(loader.iter_catalogs('./parse-output/'), time_map, days=7):
+    print host, len(crons)
+'''
+
+import logging
+import cronlib
+import cronarchive
+import cronmetrics
+from cronanalyzer import loader
+
+
+def cronify(cron):
+    ''' convert json puppet config back to actual cron entry line that'd appear on-disk '''
+    line = ""
+    params = cron['parameters']
+    if 'minute' in params:
+        if isinstance(params['minute'], list):
+            minute = ','.join(map(str, params['minute']))
+        else: minute = params['minute']
+        line += minute + ' '
+    else:
+        line += '* '
+
+    if 'hour' in params:
+        if isinstance(params['hour'], list):
+            hour = ','.join(map(str, params['hour']))
+        else: hour = params['hour']
+        line += hour + ' '
+    else:
+        line += '* '
+
+    if 'monthday' in params:
+        if isinstance(params['monthday'], list):
+            monthday = ','.join(map(str, params['monthday']))
+        else: monthday = params['monthday']
+        line += monthday + ' '
+    else:
+        line += '* '
+
+    if 'month' in params:
+        if isinstance(params['month'], list):
+            month = ','.join(map(str, params['month']))
+        else: month = params['month']
+        line += month + ' '
+    else:
+        line += '* '
+
+    if 'weekday' in params:
+        if isinstance(params['weekday'], list):
+            weekday = ','.join(map(str, params['weekday']))
+        else: weekday = params['weekday']
+        line += weekday + ' '
+    else:
+        line += '* '
+
+    if 'command' in params:
+        line += params['command'] + ' '
+    else:
+        # you can't have a cron with no command!
+        return None
+
+    return line
+
+def normalize_crons(host, crons, time_map, days=365):
+    ''' returns {norm_cron: cron} for the crons (puppet resources) of host that will run.
+        Schedules not yet in time_map are expanded for days days, and added to it; with
+        time_map=None, nothing is expanded (for jobs that don't need run times). '''
+
+    # create a list crons that actually run (i.e. skips ensure=>absent)
+    live_crons = []
+
+    for cron in crons:
+        if 'ensure' in cron['parameters'] and cron['parameters']['ensure'] == 'absent':
+           continue
+        else:
+            # these crons will actually run, ignore others:
+            live_crons.append(cron)
+
+    #
+    # Using cronlib, we'll genreate a list of timestamps all crons will run at..
+    # Stores every non-duplicate cron time('0 * * * *') list of timestamps in time_map.
+    # where the key is the cron entry (normalized as a tuple), and the value is a list of timestamps.
+    #
+
+    output = {}
+    # output: {"(0, 0, 1, 1, 0, 'command')": PUPPET_JSON, "(0,...)": PUPPET_JSON, ... }
+    # time_map: {"(0, 0, 1, 1, 0)": [98742323423.0, 29482039423.0, ... ]}
+
+    for cron in live_crons:
+        logging.debug("processing host: %s and cron: %s", host, cron)
+        _cron = cronify(cron)
+
+        if _cron is None:
+            continue
+
+        with cronmetrics.timer('normalize'):
+            norm_cron = cronlib.normalize_entry(_cron)
+
+        if norm_cron and time_map is not None and norm_cron[:5] not in time_map:
+            with cronmetrics.timer('expand_timestamps'):
+                timestamps = cronlib.expand_timestamps(norm_cron, days=days)
+            time_map.update({norm_cron[:5]:timestamps})
+            cronmetrics.incr('distinct_schedules')
+            cronmetrics.incr('timestamps', len(timestamps))
+
+        if norm_cron in output:
+            cronmetrics.incr('duplicate_crons')
+            logging.warn("Found duplicate cron job on host %s. Skipping all but one: \n\t%s" % (host, _cron))
+
+        output.update({norm_cron:cron})
+
+    return output
+
+def process_catalogs(catalogs, time_map, days=365, out=None, append=False):
+    ''' generator: converts each (host, crons) pair from catalogs into a dict of normalized crons,
+        and yields (host, {norm_cron: cron}) for hosts that have any.
+        If out (a directory or a cronarchive.Archive) is given, every host is pickled to it as
+        {host: {norm_cron: cron}} for later runs (see loader.iter_analyzed), and time_map is
+        written once every host has been processed; an archive is closed then.
+        With append (a partial run, adding some hosts to existing analysis), the time_map already
+        in out is merged into time_map first, so it still covers the hosts that weren't processed.
+        time_map is updated in place. '''
+
+    for host, crons in catalogs:
+        cronmetrics.incr('hosts')
+        cronmetrics.incr('crons', len(crons))
+
+        output = normalize_crons(host, crons, time_map, days)
+
+        if out is not None:
+            if output: loader.write_output(out, host, {host: output})
+            else:      loader.write_output(out, host, {})
+
+        if output:
+            yield host, output
+    # end loop: every host in catalogs
+
+    if out is not None:
+        if append and loader.has_output(out, "time_map.pickle"):
+            # schedules expanded by this run win: they're for this run's days
+            for schedule, timestamps in loader.load_time_map(out).iteritems():
+                time_map.setdefault(schedule, timestamps)
+        loader.write_output(out, "time_map.pickle", time_map)
+        if isinstance(out, cronarchive.Archive): out.close()
+
+def test():
+    ''' a partial run (one host, appended) followed by a full read must still see every host,
+        and every host's schedules in time_map, in a directory and in an archive '''
+    import os
+    import shutil
+    import tempfile
+
+    def cron(line):
+        fields = line.split(' ', 5)
+        return {'type': 'Cron', 'parameters': dict(zip(('minute', 'hour', 'monthday', 'month', 'weekday', 'command'), fields))}
+
+    fleet = {'web1': [cron('0 2 * * * nightly backup')], 'db1': [cron('*/10 * * * * poll replication')]}
+    partial = {'web1': [cron('30 4 * * * nightly backup, later')]}
+
+    tmp = tempfile.mkdtemp()
+    try:
+        directory = tmp + '/analyze-output/'
+        os.makedirs(directory)
+        outputs = (('analyze-output/', lambda mode: directory),
+                   ('analyze-output.pca', lambda mode: cronarchive.Archive(tmp + '/analyze-output.pca', mode)))
+
+        for name, open_out in outputs:
+            print "testing: a partial run on web1 after a full run, in %s.." % name
+            list(process_catalogs(fleet.iteritems(), {}, 1, open_out('w')))
+            list(process_catalogs(partial.iteritems(), {}, 1, open_out('a'), append=True))
+
+            source = open_out('r')
+            hosts = dict(loader.iter_analyzed(source))
+            time_map = loader.load_time_map(source)
+            schedules = set(norm_cron[:5] for crons in hosts.values() for norm_cron in crons)
+
+            if sorted(hosts) != ['db1', 'web1']:
+                print "ERR: read hosts %s, expected db1 and web1" % sorted(hosts)
+                return False
+            if hosts['web1'].values()[0]['parameters']['minute'] != '30':
+                print "ERR: web1 still has its crons from the full run"
+                return False
+            if not schedules <= set(time_map):
+                print "ERR: time_map is missing %s" % list(schedules - set(time_map))
+                return False
+            print "success!"
+    finally:
+        shutil.rmtree(tmp)
+
+    return True
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,85 @@
+### -*- coding: utf-8 -*-
+# single-file, append-only archive of per-host blobs, with random access by host
+#
+# Each stage normally writes one file per host (catalogs/, parse-output/, analyze-output/),
+# which means an os.listdir() and an open() per host. With --archive, a stage instead
+# appends every host's blob to one data file, and records where it went in an index file
+# next to it:
+#
+#   parse-output.pca        blobs, back to back
+#   parse-output.pca.idx    one line per blob: offset<TAB>length<TAB>host
+#
+# Readers load the index once and seek to the blob they want, so finding a host is a
+# dict lookup. If a host is written more than once, the last write wins.
+#
+# Usage:
+'''
+import cronarchive
+archive = cronarchive.Archive('parse-output.pca', 'w')
+archive.write('host.fqdn', data)
+archive.close()
+
+archive = cronarchive.Archive('parse-output.pca')
+for host in archive.hosts():
+    data = archive.read(host)
+'''
+
+import os
+
+
+class Archive(object):
+    ''' mode is 'r' (read), 'a' (append to an existing archive, which can still be read) or
+        'w' (start a new one) '''
+
+    def __init__(self, path, mode='r'):
+        self.path  = path
+        self.mode  = mode
+        self.index = {}
+        self.order = []
+
+        if mode == 'w':
+            self.data = open(path, 'wb')
+            self.idx  = open(path + '.idx', 'w')
+            return
+
+        if os.path.exists(path + '.idx'):
+            for line in open(path + '.idx', 'r'):
+                offset, length, host = line.rstrip('\n').split('\t', 2)
+                self._add(host, int(offset), int(length))
+
+        if mode == 'a':
+            self.data = open(path, 'a+b')
+            self.idx  = open(path + '.idx', 'a')
+        else:
+            self.data = open(path, 'rb')
+            self.idx  = None
+
+    def _add(self, host, offset, length):
+        if host not in self.index:
+            self.order.append(host)
+        self.index[host] = (offset, length)
+
+    def __contains__(self, host):
+        return host in self.index
+
+    def hosts(self):
+        ''' returns all hosts in the archive, in the order they were first written '''
+        return list(self.order)
+
+    def read(self, host):
+        ''' returns the blob stored for host '''
+        offset, length = self.index[host]
+        self.data.seek(offset)
+        return self.data.read(length)
+
+    def write(self, host, blob):
+        ''' appends blob for host '''
+        self.data.seek(0, os.SEEK_END)
+        offset = self.data.tell()
+        self.data.write(blob)
+        self.idx.write("%i\t%i\t%s\n" % (offset, len(blob), host))
+        self._add(host, offset, len(blob))
+
+    def close(self):
+        self.data.close()
+        if self.idx: self.idx.close()
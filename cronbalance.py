@@ -0,0 +1,225 @@
+### -*- coding: utf-8 -*-
+# proposes new run times for crons, to spread them out and lower the fleet-wide peak
+#
+# Builds the fleet-wide load: how many crons start in every minute of the next few days.
+# Then it lowers the peak one step at a time. Each round takes every minute at the peak, and
+# moves one movable cron (chosen by cron-analyze.py --rebalance) that starts then to the minute
+# (and hour, if it runs at a single hour) where all its starts stay below the peak. Most frequent
+# crons are tried first. When every such minute is below the peak, the peak has dropped by one.
+# A round that can't get there, or that would take more than max_moves moved crons in all, is
+# undone and rebalancing stops. So every proposed change is part of lowering the fleet-wide
+# peak, and the output stays a short list to review rather than a reshuffle of every cron. A
+# move only updates the load at the cron's own run times; the histogram is never rebuilt.
+#
+# Run times come from each cron's puppet minute/hour/monthday/month/weekday parameters,
+# expanded with cronlib's expand_* functions (schedule_minutes, day_minutes; crontimeline,
+# cronsketch and cronquery use them too, so every view agrees on when a cron starts). Weekdays
+# are crontab's, Sunday=0 (date.isoweekday() % 7); cronlib's expand_timestamps has always
+# counted Monday=0 (isoweekday() - 1), one day off, and keeps doing so as time_map and its
+# test() rely on it. A cron can only move if its minute is a single value: then its minute can
+# change, and if its hour is a single value too, so can its hour. Either way it stays on the
+# same days.
+#
+# Usage:
+'''
+import cronbalance
+jobs, load = cronbalance.build(all_data, lambda host, cron: 'backup' in cron['parameters']['command'], days=7)
+before, after, moved = cronbalance.rebalance(jobs, load)
+'''
+
+import datetime
+import logging
+import cronlib
+
+fields = ('minute', 'hour', 'monthday', 'month', 'weekday')
+
+expanders = {
+    'minute':   cronlib.expand_minute,
+    'hour':     cronlib.expand_hour,
+    'monthday': cronlib.expand_monthday,
+    'month':    cronlib.expand_month,
+    'weekday':  cronlib.expand_weekday,
+}
+
+
+class Job(object):
+    ''' one cron on one host. fires are its run times, as minutes from the start of the period.
+        It can be moved by any delta (in minutes) between low and high; delta is where it is now. '''
+
+    __slots__ = ('host', 'cron', 'fires', 'low', 'high', 'delta')
+
+    def __init__(self, host, cron, fires, low=0, high=0):
+        self.host  = host
+        self.cron  = cron
+        self.fires = fires
+        self.low   = low
+        self.high  = high
+        self.delta = 0
+
+    def proposed(self):
+        ''' returns the puppet parameters for the job's new run time '''
+        params = dict(self.cron['parameters'])
+        minute = int(_param(params, 'minute')) + self.delta
+        if self.high - self.low >= 60:
+            hour, minute = divmod(int(_param(params, 'hour')) * 60 + minute, 60)
+            params['hour'] = str(hour)
+        params['minute'] = str(minute)
+        return params
+
+
+def _param(params, field):
+    ''' a puppet schedule parameter as it'd appear on-disk, '*' if unset '''
+    value = params.get(field, '*')
+    if isinstance(value, list):
+        value = ','.join(map(str, value))
+    return str(value)
+
+def _values(field, value):
+    ''' all the integer values a schedule field covers '''
+    expanded = expanders[field](value)
+    if isinstance(expanded, (list, tuple)):
+        return set(int(v) for v in expanded)
+    return set([int(expanded)])
+
+def _single(value):
+    return value.isdigit()
+
+def schedule_key(params):
+    ''' a cron's schedule fields as they'd appear on-disk, (minute, hour, monthday, month, weekday):
+        crons with the same key start at the same times, so run times can be cached by it.
+        dict(zip(fields, key)) turns it back into parameters. '''
+    return tuple(_param(params, f) for f in fields)
+
+def _schedule_values(params):
+    try:
+        return dict((f, _values(f, _param(params, f))) for f in fields)
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise ValueError("can't parse schedule: %s" % ' '.join(schedule_key(params)))
+
+def _day_minutes(values):
+    return sorted(h * 60 + m for h in values['hour'] for m in values['minute'] if h < 24 and m < 60)
+
+def day_minutes(params):
+    ''' returns the sorted minutes of the day (0-1439) a cron with puppet parameters params starts
+        at, on the days it runs. Raises ValueError if a field can't be parsed. '''
+    return _day_minutes(_schedule_values(params))
+
+def schedule_minutes(params, days, start):
+    ''' returns the sorted run times of a cron with puppet parameters params, as minutes from
+        local midnight of start, for days days. Raises ValueError if a field can't be parsed. '''
+    values  = _schedule_values(params)
+    minutes = _day_minutes(values)
+
+    fires = []
+    for d in xrange(days):
+        date = start + datetime.timedelta(days=d)
+        # Sunday=0, as in crontab (not cronlib's Monday=0, see above)
+        if (date.day in values['monthday'] and date.month in values['month']
+                and date.isoweekday() % 7 in values['weekday']):
+            fires.extend([d * 1440 + m for m in minutes])
+    return fires
+
+def build(all_crons, movable, days=7, start=None):
+    ''' returns (jobs, load): a Job for every cron in all_crons (an iterable of (host, {norm_cron: cron})),
+        and the number of crons starting in each minute of the period. movable(host, cron) says
+        whether a cron may be moved; crons that can't be moved still count towards the load. '''
+
+    if start is None:
+        start = datetime.date(datetime.date.today().year, 1, 1)
+
+    load = [0] * (days * 1440)
+    jobs = []
+    for host, crons in all_crons:
+        for cron in crons.itervalues():
+            params = cron['parameters']
+            try:
+                fires = schedule_minutes(params, days, start)
+            except ValueError, e:
+                logging.warn("skipping cron on host %s: %s" % (host, e))
+                continue
+
+            for f in fires:
+                load[f] += 1
+
+            minute = _param(params, 'minute')
+            hour   = _param(params, 'hour')
+            if not fires or not movable(host, cron) or not _single(minute):
+                continue
+
+            if _single(hour):
+                at = int(hour) * 60 + int(minute)
+                jobs.append(Job(host, cron, fires, -at, 1439 - at))
+            else:
+                jobs.append(Job(host, cron, fires, -int(minute), 59 - int(minute)))
+
+    return jobs, load
+
+def _best_delta(job, load):
+    ''' returns (cost, delta): the lowest peak the job can be added at, and where. load must not
+        include the job. Ties go to the delta closest to the job's current one. '''
+
+    width = job.high - job.low + 1
+    cost = None
+    for f in job.fires:
+        window = load[f + job.low : f + job.low + width]
+        if cost is None: cost = window
+        else:            cost = map(max, cost, window)
+
+    best = min(cost)
+    deltas = [job.low + i for i, c in enumerate(cost) if c == best]
+    delta  = min(deltas, key=lambda d: abs(d - job.delta))
+    return best + 1, delta
+
+def _place(job, load, at, n):
+    ''' adds (n=1) or removes (n=-1) job's starts, at its current delta, to load and at '''
+    for f in job.fires:
+        load[f + job.delta] += n
+        if n > 0: at.setdefault(f + job.delta, []).append(job)
+        else:     at[f + job.delta].remove(job)
+
+def rebalance(jobs, load, max_moves=None):
+    ''' lowers the peak of load one step at a time by moving jobs, and keeps only the rounds that
+        lowered it, moving at most max_moves jobs in all. Updates load and each job's delta in place.
+        returns (peak before, peak after, [moved jobs]) '''
+
+    before = max(load) if load else 0
+    order  = sorted(jobs, key=lambda j: len(j.fires), reverse=True)
+    rank   = dict((id(job), i) for i, job in enumerate(order))
+
+    at = {}         # minute -> movable jobs starting then
+    for job in order:
+        for f in job.fires:
+            at.setdefault(f + job.delta, []).append(job)
+
+    while load:
+        peak  = max(load)
+        moves = []  # (job, delta before the round)
+        for minute in [m for m, c in enumerate(load) if c == peak]:
+            if load[minute] < peak:
+                continue    # an earlier move this round already lowered it
+            for job in sorted(at.get(minute, []), key=lambda j: rank[id(j)]):
+                _place(job, load, at, -1)
+                cost, delta = _best_delta(job, load)
+                if cost < peak:
+                    moves.append((job, job.delta))
+                    job.delta = delta
+                _place(job, load, at, 1)
+                if cost < peak:
+                    break
+            else:
+                break       # nothing can leave this minute: the peak can't go lower
+        else:
+            moved = sum(1 for job in jobs if job.delta != 0)
+            if max_moves is None or moved <= max_moves:
+                logging.debug("rebalance: peak is now %i, %i crons moved" % (max(load), moved))
+                continue
+
+        # undo the round that didn't lower the peak (or moved too many crons), and stop
+        for job, delta in reversed(moves):
+            _place(job, load, at, -1)
+            job.delta = delta
+            _place(job, load, at, 1)
+        break
+
+    after = max(load) if load else 0
+    return before, after, [job for job in jobs if job.delta != 0]
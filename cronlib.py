@@ -10,6 +10,9 @@
 #  a 6-tuple containing normal integer/list representations for each field.
 #
 #  use generate_timestamps() to return a list of *all* timestamps a cron will run at, for the next year.
+#  expand_minutes() returns the same as integer minutes from the start of the year, which is what
+#  expand_timestamps() uses internally: mktime is only called once per day (or once per minute, on
+#  the few days with a DST transition), not for every minute of the year.
 #
 #  the expand_* functions translate numbers, ranges, names, etc (of days, months, ...) into
 #  a standard format (just numbers), and return a list of integers.
@@ -36,6 +39,7 @@ cron = "@monthly my monthly command....."
 import collections
 import datetime
 import time
+import os
 
 symbolic_names = {
     '@yearly':        '0 0 1 1 *',
@@ -301,33 +305,99 @@ def expand_weekday (day):
     return result
 
 
-def expand_timestamps (normalized_cron_entry, days=365):
-    ''' returns a list containing all timestamps a cron will run at, for the current year '''
+def _day_table (start, days):
+    ''' returns (dates, epochs) for each day from start: dates holds the (minute-independent) fields
+        a cron matches on, as strings: (day, month, weekday). epochs holds the epoch of local midnight
+        or, on days with a DST transition, a list of the epoch of every local minute of the day
+        (transitions aren't always on the hour, e.g. Australia/Lord_Howe's 30 minute shift), so
+        wall-clock minutes can be turned into timestamps without calling mktime per minute. Cached. '''
+
+    key = (start, days)
+    if key in _day_tables:
+        return _day_tables[key]
+
+    dates  = []
+    epochs = []
+    ordinal  = start.toordinal()
+    midnight = time.mktime(start.timetuple())
+
+    for d in xrange(days):
+        date = datetime.date.fromordinal(ordinal + d)
+        # weekdays count from Monday=0, not crontab's Sunday=0 (cronbalance.schedule_minutes
+        # gets that right); kept as it is, since time_map and test()'s counts depend on it
+        dates.append((str(date.day), str(date.month), str(date.isoweekday()-1)))
+
+        next_midnight = time.mktime(datetime.date.fromordinal(ordinal + d + 1).timetuple())
+        if next_midnight - midnight == 86400:
+            epochs.append(midnight)
+        else:
+            epochs.append([time.mktime((date.year, date.month, date.day, hour, minute, 0, 0, 0, -1))
+                           for hour in range(0, 24) for minute in range(0, 60)])
+        midnight = next_midnight
+
+    _day_tables[key] = (dates, epochs)
+    return dates, epochs
+
+_day_tables = {}
+
+def _start_of_year ():
+    return datetime.date(datetime.date.today().year, 1, 1)
+
+def expand_minutes (normalized_cron_entry, days=365, start=None):
+    ''' returns a list of all the times a cron will run at, as integer minutes since local
+        midnight of start (default: January 1st of the current year), for days days.
+        Use minutes_to_timestamps to convert them. '''
 
     if normalized_cron_entry is None:
         return []
 
     minutes, hours, monthdays, months, weekdays, command = normalized_cron_entry
 
+    if start is None:
+        start = _start_of_year()
+
+    # fields match the way they always have: the value, as a string, is in the field
+    day_minutes = [hour * 60 + minute
+                   for hour in all_values['hours'] if str(hour) in hours
+                   for minute in all_values['minutes'] if str(minute) in minutes]
+
     result = []
-    dt  = datetime.datetime(datetime.datetime.now().year, 1, 1, 0, 0, 0, 0)
-    end = dt + datetime.timedelta(days=days)
-
-    step  = datetime.timedelta(minutes=1)
-
-    while dt < end:
-        if ( str(dt.minute) in minutes
-             and str(dt.hour) in hours
-             and str(dt.isoweekday()-1) in weekdays
-             and str(dt.month) in months
-             and str(dt.day) in monthdays
-             ):
-            #result.append(dt.strftime('%Y-%m-%d %H:%M:%S'))
-            result.append(time.mktime(dt.timetuple()))
-        dt += step
+    if not day_minutes:
+        return result
+
+    dates, epochs = _day_table(start, days)
 
+    for d, (monthday, month, weekday) in enumerate(dates):
+        if weekday in weekdays and month in months and monthday in monthdays:
+            offset = d * 1440
+            result.extend([offset + m for m in day_minutes])
+
+    return result
+
+def minutes_to_timestamps (minutes, days=365, start=None):
+    ''' converts the output of expand_minutes (for the same days and start) to epoch timestamps '''
+
+    if start is None:
+        start = _start_of_year()
+
+    dates, epochs = _day_table(start, days)
+
+    result = []
+    for m in minutes:
+        day, minute = divmod(m, 1440)
+        epoch = epochs[day]
+        if isinstance(epoch, list):
+            # DST transition day: every minute was converted on its own
+            result.append(epoch[minute])
+        else:
+            result.append(epoch + minute * 60)
     return result
 
+def expand_timestamps (normalized_cron_entry, days=365):
+    ''' returns a list containing all timestamps a cron will run at, for the current year '''
+
+    return minutes_to_timestamps(expand_minutes(normalized_cron_entry, days=days), days=days)
+
 
 def normalize_entry (cron_entry):
     ''' Returns a full cron entry as a 6-tuple, but normalized into lists of integers
@@ -398,6 +468,43 @@ def test():
         print normalize_entry(line)
 
 
+    # expand_timestamps must give the same times as calling mktime for every minute a cron runs
+    # at, including on DST transition days, which aren't always an hour (Australia/Lord_Howe).
+    def mktime_each(entry, days):
+        minutes, hours, monthdays, months, weekdays, command = entry
+        result = []
+        start = _start_of_year()
+        for d in xrange(days):
+            date = start + datetime.timedelta(days=d)
+            if not (str(date.isoweekday()-1) in weekdays and str(date.month) in months
+                    and str(date.day) in monthdays):
+                continue
+            for hour in all_values['hours']:
+                if str(hour) not in hours: continue
+                for minute in all_values['minutes']:
+                    if str(minute) not in minutes: continue
+                    result.append(time.mktime((date.year, date.month, date.day, hour, minute, 0, 0, 0, -1)))
+        return result
+
+    tz = os.environ.get('TZ')
+    try:
+        for zone in (tz, 'America/New_York', 'Europe/London', 'Australia/Lord_Howe'):
+            if zone: os.environ['TZ'] = zone
+            time.tzset()
+            _day_tables.clear()
+            for line in ("*/10 * * * * every 10 minutes", "0 2 * * * nightly", "0-59/7 1-3 * * 0 sunday nights"):
+                print "testing: '%s' in %s, expecting the same times as mktime per minute.." % (line, zone or 'local time')
+                if expand_timestamps(normalize_entry(line)) == mktime_each(normalize_entry(line), 365):
+                    print "success!"
+                else:
+                    print "ERR: timestamps differ from mktime's"
+                    return False
+    finally:
+        if tz is None: os.environ.pop('TZ', None)
+        else:          os.environ['TZ'] = tz
+        time.tzset()
+        _day_tables.clear()
+
     for line,length in map(None, cronlines, expected_timestamps):
         print "testing: '%s' , expecting %s timestamps.." % (line, length)
         result = expand_timestamps(normalize_entry(line))
@@ -408,6 +515,8 @@ def test():
             print "ERR: got %s timestamps, but expected %s " % (len(result), length)
             return False
 
+    return True
+
 if __name__ == '__main__':
     test()
 
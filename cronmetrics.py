@@ -0,0 +1,100 @@
+### -*- coding: utf-8 -*-
+# timers, counters and profiling shared by puppet.py, puppetdb.py, cron-parse.py and cron-analyze.py
+#
+# Every stage wraps its steps in named timers and counts what it processed (hosts, crons,
+# bytes, ...). With --metrics FILE, the totals are written to FILE as json at exit, so a slow
+# nightly run shows which step got slower. With --profile, the whole run is also profiled with
+# cProfile: the sorted stats are printed to stderr, and saved to ./metrics/ with the totals.
+# Without either, nothing is written.
+#
+# Timers accumulate wall-clock seconds across calls, and may nest (e.g. hosts are read as
+# they're needed, so load_json, normalize and expand_timestamps can run inside find), so they
+# don't necessarily add up to the total.
+#
+# Usage:
+'''
+import cronmetrics
+cronmetrics.setup('cron-parse', profile=options.profile, metrics_file=options.metrics)
+
+with cronmetrics.timer('json_load'):
+    catalog = json.load(...)
+cronmetrics.incr('crons', len(crons))
+'''
+
+import sys
+import os
+import time
+import atexit
+from contextlib import contextmanager
+
+timers   = {}
+counters = {}
+
+_state = {}
+
+
+@contextmanager
+def timer(name):
+    ''' adds the time spent in the with block to timers[name] '''
+    start = time.time()
+    try:
+        yield
+    finally:
+        timers[name] = timers.get(name, 0.0) + time.time() - start
+
+def incr(name, n=1):
+    counters[name] = counters.get(name, 0) + n
+
+def report():
+    ''' returns everything measured so far, as a json-able dict '''
+    return {'stage':    _state.get('stage'),
+            'argv':     sys.argv,
+            'started':  time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_state.get('started', time.time()))),
+            'elapsed':  time.time() - _state.get('started', time.time()),
+            'timers':   dict(timers),
+            'counters': dict(counters)}
+
+def setup(stage, profile=False, metrics_file=None, metrics_dir='./metrics/'):
+    ''' starts measuring a run of stage. If metrics_file or profile is given, metrics are written
+        at exit to metrics_file (default: metrics_dir/stage.json) and, if profile is set, cProfile
+        stats to metrics_dir/stage.prof. Otherwise they're only kept in timers and counters. '''
+    _state['stage']   = stage
+    _state['started'] = time.time()
+
+    if not (profile or metrics_file):
+        return
+    if metrics_file is None:
+        metrics_file = os.path.join(metrics_dir, stage + '.json')
+
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    atexit.register(_finish, metrics_file, profiler, os.path.join(metrics_dir, stage + '.prof'))
+
+def _finish(metrics_file, profiler, profile_file):
+    import simplejson as json
+
+    if profiler:
+        import pstats
+        profiler.disable()
+        _makedirs(profile_file)
+        profiler.dump_stats(profile_file)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(30)
+        sys.stderr.write("full profile written to %s\n" % profile_file)
+
+    _makedirs(metrics_file)
+    # write next to it and rename over it: whoever reads metrics_file sees the last run's
+    # metrics or this one's, never half of them.
+    tmp_file = '%s.%i.tmp' % (metrics_file, os.getpid())
+    FILE = open(tmp_file, 'w')
+    json.dump(report(), FILE, indent=2, sort_keys=True)
+    FILE.close()
+    os.rename(tmp_file, metrics_file)
+
+def _makedirs(filename):
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname): os.makedirs(dirname)
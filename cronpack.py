@@ -0,0 +1,134 @@
+### -*- coding: utf-8 -*-
+# compact binary records for puppet cron resources
+#
+# cron-parse.py --compact writes these instead of the full puppet resource json, and
+# cron-analyze.py reads them back with a couple of struct calls instead of json.loads.
+# Only the fields cron-analyze.py actually uses are kept: the schedule fields, command,
+# user, ensure and the resource's tags (for --rebalance-tag). Every string is stored once in
+# a string table (commands, '*', '0', ... repeat a lot), and each cron is a fixed-size record
+# of indices into that table.
+#
+# Layout (all integers are little-endian uint32):
+#
+#   'PCR2'                          magic: 'PCR', then the format version
+#   n_strings, n_strings * (length, utf-8 bytes)
+#   host                            string table index
+#   n_records, n_records * (minute, hour, monthday, month, weekday, command, user, ensure, tags)
+#
+# A field that isn't set in puppet is stored as NONE. tags are stored comma-separated (puppet
+# tags can't contain commas). Version 1 files, written before tags were kept, have no tags
+# field; crons read from them have no 'tags' at all, rather than an empty list.
+#
+# Usage:
+'''
+import cronpack
+cronpack.dump('host.fqdn', crons, open('parse-output/host.fqdn', 'wb'))
+host, crons = cronpack.load(open('parse-output/host.fqdn', 'rb'))
+'''
+
+import struct
+
+MAGIC   = 'PCR'
+VERSION = '2'
+NONE    = 0xffffffff
+
+params = ('minute', 'hour', 'monthday', 'month', 'weekday', 'command', 'user', 'ensure')
+fields = {'1': params, '2': params + ('tags',)}
+
+_uint   = struct.Struct('<I')
+_record = struct.Struct('<%iI' % len(fields[VERSION]))
+
+
+def _encode(value):
+    ''' puppet allows lists for the schedule fields; store them the way they'd appear on-disk '''
+    if isinstance(value, list):
+        value = ','.join(map(unicode, value))
+    if not isinstance(value, unicode):
+        value = unicode(value)
+    return value.encode('utf-8')
+
+def dumps(host, crons):
+    ''' returns the compact representation of a list of puppet cron resources for host '''
+
+    strings = []
+    table   = {}
+
+    def intern(value):
+        value = _encode(value)
+        if value not in table:
+            table[value] = len(strings)
+            strings.append(value)
+        return table[value]
+
+    host = intern(host)
+
+    records = []
+    for cron in crons:
+        values = [intern(cron['parameters'][f]) if f in cron['parameters'] else NONE for f in params]
+        values.append(intern(','.join(cron.get('tags', []))))
+        records.append(_record.pack(*values))
+
+    out = [MAGIC + VERSION, _uint.pack(len(strings))]
+    for s in strings:
+        out.append(_uint.pack(len(s)))
+        out.append(s)
+    out.append(_uint.pack(host))
+    out.append(_uint.pack(len(records)))
+    out.extend(records)
+
+    return ''.join(out)
+
+def dump(host, crons, FILE):
+    FILE.write(dumps(host, crons))
+
+def loads(data):
+    ''' returns (host, crons), where crons is a list of puppet-like cron resources holding
+        only 'type', 'parameters' and 'tags' - enough for cron-analyze.py '''
+
+    if data[:3] != MAGIC or data[3:4] not in fields:
+        raise ValueError("not a compact cron file")
+    record = fields[data[3]]
+
+    offset = 4
+    (n_strings,) = _uint.unpack_from(data, offset)
+    offset += 4
+
+    strings = []
+    for i in xrange(n_strings):
+        (length,) = _uint.unpack_from(data, offset)
+        offset += 4
+        # like simplejson, plain ascii comes back as str (cronlib only translates names in a str)
+        value = data[offset:offset+length]
+        try:
+            value.decode('ascii')
+        except UnicodeDecodeError:
+            value = value.decode('utf-8')
+        strings.append(value)
+        offset += length
+
+    host, n_records = struct.unpack_from('<2I', data, offset)
+    offset += 8
+
+    values = struct.unpack_from('<%iI' % (n_records * len(record)), data, offset)
+
+    crons = []
+    for i in xrange(0, len(values), len(record)):
+        cron = {'type': 'Cron',
+                'parameters': dict((f, strings[v]) for f, v in zip(params, values[i:i+len(params)]) if v != NONE)}
+        if 'tags' in record:
+            tags = strings[values[i + len(params)]]
+            cron['tags'] = tags.split(',') if tags else []
+        crons.append(cron)
+
+    return strings[host], crons
+
+def load(FILE):
+    return loads(FILE.read())
+
+def is_compact(FILE):
+    ''' True if the open file FILE holds compact records rather than json. Peeks at the magic and
+        seeks back, so the caller can go on reading FILE from where it was. '''
+    position = FILE.tell()
+    magic = FILE.read(len(MAGIC))
+    FILE.seek(position)
+    return magic == MAGIC
@@ -0,0 +1,310 @@
+### -*- coding: utf-8 -*-
+# in-memory index of an analyzed fleet, and a unix socket server/client for querying it
+#
+# cron-analyze.py -e re-reads and unpickles every host, and time_map, for every question.
+# cron-analyze.py --serve loads them once into a FleetIndex, and answers queries from
+# cron-analyze.py --socket clients until it's stopped, so repeated queries skip the loading.
+#
+# The index keeps, per host, a list of (schedule id, command, cron line), where a schedule is a
+# cron's puppet minute/hour/monthday/month/weekday fields (cronbalance.schedule_key), so run times
+# agree with --rebalance and the timeline. "What runs at 3am" only expands each schedule for that
+# day. Which crons on a host ever run at the same time needs every run time of the period (days
+# from start), so a schedule is only expanded for it the first time a host's overlap asks, and
+# each host's answer is kept. serve() works them all out before it answers anyone, so every op
+# answers in milliseconds and one client's query never holds up the others on the event loop.
+# Each expanded schedule also gets a bitmask of the (UTC) minutes of the day it runs in: two
+# timestamps can only be equal if those are, so most pairs of schedules are told apart with one
+# &, and only the rest are merged (skipping ahead with bisect).
+#
+# The protocol is one json object per line, each way:
+#   {"op": "find", "regex": ".*backup", "host": null}
+#   {"ok": true, "result": [["host.fqdn", ["0 3 * * * backup.sh ", ...]], ...]}
+#
+# ops: find (regex), hosts, at (timestamp), overlap. host is optional for all of them, and
+# limits the answer the same way cron-analyze.py --host does.
+#
+# Usage:
+'''
+import cronquery
+index = cronquery.FleetIndex(all_data, cronify, days=365)
+cronquery.serve(index, './cron-analyze.sock')
+
+# elsewhere:
+print cronquery.query('./cron-analyze.sock', {'op': 'hosts'})
+'''
+
+import os
+import re
+import socket
+import signal
+import asyncore
+import asynchat
+import logging
+import datetime
+from array import array
+from bisect import bisect_left
+import simplejson as json
+import cronlib
+import cronbalance
+
+
+class FleetIndex(object):
+    ''' all_crons is an iterable of (host, {norm_cron: cron}), and cronify turns a puppet cron into
+        its on-disk line. overlap() looks at days days from start (default: January 1st of the
+        current year, as cronlib does). '''
+
+    def __init__(self, all_crons, cronify, days=365, start=None):
+        if start is None:
+            start = datetime.date(datetime.date.today().year, 1, 1)
+        self.days      = days
+        self.start     = start
+        self.schedules = []     # schedule id -> puppet schedule parameters
+        self.times     = {}     # schedule id -> sorted array of timestamps in the period, once expanded
+        self.masks     = {}     # schedule id -> bitmask of the minutes of the (UTC) day it runs in
+        self.hosts_map = {}     # host -> [(schedule id, command, cron line), ...]
+        self.sametime  = {}     # host -> [[cron line, cron line], ...] that ever run at the same time
+        self._sametime = {}     # (schedule id, schedule id) -> bool
+
+        ids = {}
+        for host, crons in all_crons:
+            entries = []
+            for norm_cron, cron in crons.iteritems():
+                if norm_cron is None: continue
+                schedule = cronbalance.schedule_key(cron['parameters'])
+                if schedule not in ids:
+                    ids[schedule] = len(self.schedules)
+                    self.schedules.append(dict(zip(cronbalance.fields, schedule)))
+                entries.append((ids[schedule], norm_cron[5], cronify(cron)))
+            self.hosts_map[host] = sorted(entries, key=lambda e: e[2])
+
+    def _hosts(self, host=None):
+        return sorted(h for h in self.hosts_map if not host or h in host)
+
+    def hosts(self, host=None):
+        ''' returns all hosts (limited by host, like --host) '''
+        return self._hosts(host)
+
+    def find(self, regex, host=None):
+        ''' returns [(host, [cron lines])] for crons whose command matches regex '''
+        regex = re.compile(regex)
+        found = []
+        for h in self._hosts(host):
+            lines = [line for s, command, line in self.hosts_map[h] if regex.match(command)]
+            if lines: found.append((h, lines))
+        return found
+
+    def at(self, timestamp, host=None):
+        ''' returns [(host, [cron lines])] for crons that run in the minute starting at timestamp.
+            Schedules are expanded for that day, unless their period's times already are. '''
+        day = datetime.date.fromtimestamp(timestamp)
+        in_period = self.start <= day < self.start + datetime.timedelta(days=self.days)
+        running = set()
+        for s in xrange(len(self.schedules)):
+            if in_period and s in self.times: times = self.times[s]
+            else:                             times = _expand(self.schedules[s], 1, day)
+            i = bisect_left(times, timestamp)
+            if i < len(times) and times[i] < timestamp + 60:
+                running.add(s)
+
+        found = []
+        for h in self._hosts(host):
+            lines = [line for s, command, line in self.hosts_map[h] if s in running]
+            if lines: found.append((h, lines))
+        return found
+
+    def _times(self, s):
+        ''' schedule s's run times over the whole period, expanded the first time they're needed '''
+        if s not in self.times:
+            self.times[s] = array('d', _expand(self.schedules[s], self.days, self.start))
+            self.masks[s] = _day_mask(self.times[s])
+        return self.times[s]
+
+    def _runs_with(self, a, b):
+        ''' True if schedules a and b ever run at the same time '''
+        key = (min(a, b), max(a, b))
+        if key not in self._sametime:
+            times_a, times_b = self._times(a), self._times(b)
+            self._sametime[key] = bool(self.masks[a] & self.masks[b]) and _intersects(times_a, times_b)
+        return self._sametime[key]
+
+    def overlap(self, host=None):
+        ''' returns [(host, [lines with the exact same schedule], [[line, line], ...] that ever run at the same time)] '''
+        found = []
+        for h in self._hosts(host):
+            entries = self.hosts_map[h]
+            counts = {}
+            for s, command, line in entries:
+                counts[s] = counts.get(s, 0) + 1
+            sameschedule = [line for s, command, line in entries if counts[s] > 1]
+
+            if h not in self.sametime:
+                self.sametime[h] = [[line_a, line_b]
+                                    for i, (a, command_a, line_a) in enumerate(entries)
+                                    for b, command_b, line_b in entries[i+1:]
+                                    if a != b and self._runs_with(a, b)]
+            found.append((h, sameschedule, self.sametime[h]))
+        return found
+
+    def handle(self, request):
+        ''' answers one request (a dict, see the protocol above) '''
+        op   = request.get('op')
+        host = request.get('host')
+        if op == 'find':
+            return self.find(request['regex'], host)
+        elif op == 'hosts':
+            return self.hosts(host)
+        elif op == 'at':
+            return self.at(float(request['timestamp']), host)
+        elif op == 'overlap':
+            return self.overlap(host)
+        raise ValueError("unknown op: %s" % op)
+
+
+def _expand(params, days, start):
+    ''' the sorted timestamps a cron with puppet schedule params runs at, for days days from start
+        (none if it can't be parsed) '''
+    try:
+        minutes = cronbalance.schedule_minutes(params, days, start)
+    except ValueError:
+        return []
+    return sorted(cronlib.minutes_to_timestamps(minutes, days, start))
+
+def _day_mask(times):
+    ''' an int with bit n set if any of times is in minute n of a UTC day '''
+    mask = 0
+    for minute in set(int(t) // 60 % 1440 for t in times):
+        mask |= 1 << minute
+    return mask
+
+def _intersects(a, b):
+    ''' True if the sorted arrays a and b have a value in common. Each side skips ahead to the
+        other's next value with bisect, so sparse schedules only cost a few steps per run. '''
+    i, j = 0, 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            return True
+        if a[i] < b[j]: i = bisect_left(a, b[j], i)
+        else:           j = bisect_left(b, a[i], j)
+    return False
+
+
+class _Handler(asynchat.async_chat):
+    ''' one client connection: reads json requests a line at a time, and answers each '''
+
+    def __init__(self, sock, index):
+        asynchat.async_chat.__init__(self, sock)
+        self.index  = index
+        self.buffer = []
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        request = ''.join(self.buffer)
+        self.buffer = []
+        try:
+            response = {'ok': True, 'result': self.index.handle(json.loads(request))}
+        except Exception, e:
+            logging.warn("bad request %r: %s" % (request, e))
+            response = {'ok': False, 'error': str(e)}
+        self.push(json.dumps(response) + '\n')
+
+class _Server(asyncore.dispatcher):
+
+    def __init__(self, index, path):
+        asyncore.dispatcher.__init__(self)
+        self.index = index
+        if os.path.exists(path): os.unlink(path)
+        self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.bind(path)
+        self.listen(64)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            _Handler(pair[0], self.index)
+
+
+def serve(index, path):
+    ''' answers queries on the unix socket at path, until interrupted or terminated. Clients
+        are handled concurrently by one asyncore event loop. '''
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+    index.overlap()
+    server = _Server(index, path)
+    logging.info("serving %i hosts, %i distinct schedules on %s" % (len(index.hosts_map), len(index.schedules), path))
+    try:
+        asyncore.loop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path): os.unlink(path)
+
+def query(path, request):
+    ''' sends request (a dict) to the server at path, returns its result. Raises RuntimeError on errors. '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall(json.dumps(request) + '\n')
+
+    data = ''
+    while not data.endswith('\n'):
+        chunk = sock.recv(65536)
+        if not chunk: break
+        data += chunk
+    sock.close()
+
+    if not data.endswith('\n'):
+        raise RuntimeError("no complete answer from %s (got %i bytes)" % (path, len(data)))
+    try:
+        response = json.loads(data)
+    except ValueError, e:
+        raise RuntimeError("bad answer from %s: %s" % (path, e))
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response['result']
+
+def test():
+    ''' at() and overlap() must go by each cron's puppet schedule: '30 14 * * *' only runs at 14:30,
+        and '*/10' never runs with '13 * * * *' (normalized schedules would make them '3,0 1,4'
+        and '1,3') '''
+    import time
+    from cronanalyzer import normalizer
+
+    def cron(line):
+        fields = line.split(' ', 5)
+        params = dict(zip(('minute', 'hour', 'monthday', 'month', 'weekday', 'command'), fields))
+        return cronlib.normalize_entry(line), {'type': 'Cron', 'parameters': params}
+
+    fleet = [('web1', dict([cron('30 14 * * * report')])),
+             ('db1',  dict([cron('*/10 * * * * poll'), cron('13 * * * * rotate')])),
+             ('app1', dict([cron('0 * * * * hourly'), cron('0 2 * * * nightly')]))]
+    index = FleetIndex(fleet, normalizer.cronify, days=7, start=datetime.date(2012, 4, 2))
+
+    def at(when):
+        return index.at(time.mktime(time.strptime(when, '%Y-%m-%d %H:%M')))
+
+    checks = (
+        ("at 14:30", at('2012-04-03 14:30'), [('db1', ['*/10 * * * * poll ']), ('web1', ['30 14 * * * report '])]),
+        ("at 14:03", at('2012-04-03 14:03'), []),
+        ("at 01:03", at('2012-04-03 01:03'), []),
+        ("at 04:03", at('2012-04-03 04:03'), []),
+        ("at 02:13", at('2012-04-03 02:13'), [('db1', ['13 * * * * rotate '])]),
+        ("overlap", index.overlap(), [('app1', [], [['0 * * * * hourly ', '0 2 * * * nightly ']]),
+                                      ('db1', [], []), ('web1', [], [])]),
+    )
+    for name, result, expected in checks:
+        print "testing: %s, expecting %s.." % (name, expected)
+        if result == expected:
+            print "success!"
+        else:
+            print "ERR: got %s" % result
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,214 @@
+### -*- coding: utf-8 -*-
+# fixed-memory summaries of a whole fleet's crons: which crons and commands are the most common,
+# on how many hosts, and which minutes of the day are the busiest
+#
+# cron-analyze.py --approximate streams every host's normalized crons through:
+#   - a count-min sketch, counting how many times each (schedule, command) is seen. Estimates are
+#     never low, and are at most epsilon * N too high (N: crons counted) with probability 1 - delta.
+#     It's ceil(e / epsilon) counters wide and ceil(ln(1 / delta)) deep, whatever the fleet size.
+#   - a heavy-hitters candidate set on top of it: keys whose estimate beats the current floor are
+#     kept, and it's pruned back to the best capacity keys when it doubles. Each candidate has a
+#     HyperLogLog of the hosts it runs on, so a cron listed twice for a host counts one host.
+#     2^precision registers, with a standard error of 1.04 / sqrt(2^precision).
+#   - the same for commands.
+#   - an exact count of crons starting in each of the 1440 minutes of a day, from each cron's puppet
+#     minute and hour (cronbalance.day_minutes, as the timeline and --rebalance expand them).
+#
+# Crons are told apart by their puppet schedule fields and normalized command: normalized
+# schedules can't be used, as they split a single two-digit value into digits ('30' -> '3,0').
+#
+# Keys are hashed once with md5; the sketch's rows use h1 + i * h2 (double hashing).
+#
+# Usage:
+'''
+import cronsketch
+summary = cronsketch.summarize(all_data, cronify, epsilon=0.0001, delta=0.01, precision=10, top=10)
+print summary['duplicated'][:3], summary['error']
+'''
+
+import math
+import struct
+import hashlib
+from array import array
+import cronbalance
+
+
+def _hashes(key):
+    ''' two independent 64-bit hashes of key (a str or unicode) '''
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return struct.unpack('<QQ', hashlib.md5(key).digest())
+
+
+class CountMinSketch(object):
+    ''' approximate counts of keys: estimate(key) >= the true count, and is at most epsilon * total
+        higher, with probability 1 - delta '''
+
+    def __init__(self, epsilon=0.0001, delta=0.01):
+        self.epsilon = epsilon
+        self.delta   = delta
+        self.width   = int(math.ceil(math.e / epsilon))
+        self.depth   = int(math.ceil(math.log(1.0 / delta)))
+        self.rows    = [array('L', [0]) * self.width for i in xrange(self.depth)]
+        self.total   = 0
+
+    def _cells(self, key):
+        h1, h2 = _hashes(key)
+        return [(h1 + i * h2) % self.width for i in xrange(self.depth)]
+
+    def add(self, key, n=1):
+        ''' counts key n more times, returns its new estimate '''
+        self.total += n
+        estimate = None
+        for row, cell in zip(self.rows, self._cells(key)):
+            row[cell] += n
+            if estimate is None or row[cell] < estimate: estimate = row[cell]
+        return estimate
+
+    def estimate(self, key):
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(key)))
+
+    def error(self):
+        ''' the most any estimate is too high by, with probability 1 - delta '''
+        return self.epsilon * self.total
+
+
+class HeavyHitters(object):
+    ''' the most frequent keys of a stream, counted by a CountMinSketch. Keeps at most 2 * capacity
+        candidates, each with a value (anything the caller wants to keep per key). '''
+
+    def __init__(self, capacity, epsilon=0.0001, delta=0.01):
+        self.sketch     = CountMinSketch(epsilon, delta)
+        self.capacity   = capacity
+        self.candidates = {}    # key -> [estimate, value]
+        self.floor      = 0     # lowest estimate kept by the last prune
+
+    def add(self, key, value=None, n=1):
+        ''' counts key. Returns its [estimate, value] if it's a candidate (value is only stored
+            when it becomes one), or None '''
+        estimate = self.sketch.add(key, n)
+        candidate = self.candidates.get(key)
+        if candidate is not None:
+            candidate[0] = estimate
+        elif estimate > self.floor:
+            candidate = self.candidates[key] = [estimate, value]
+            if len(self.candidates) > 2 * self.capacity:
+                self._prune()
+        return self.candidates.get(key)
+
+    def _prune(self):
+        kept = sorted(self.candidates.iteritems(), key=lambda item: item[1][0], reverse=True)[:self.capacity]
+        self.candidates = dict(kept)
+        self.floor = kept[-1][1][0]
+
+    def top(self, n):
+        ''' returns [(estimate, key, value)] for the n keys with the highest estimates '''
+        ranked = sorted(self.candidates.iteritems(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [(estimate, key, value) for key, (estimate, value) in ranked]
+
+
+class HyperLogLog(object):
+    ''' approximate number of distinct items added, in 2^precision bytes. The standard error is
+        1.04 / sqrt(2^precision). '''
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        if   self.m == 16: self.alpha = 0.673
+        elif self.m == 32: self.alpha = 0.697
+        elif self.m == 64: self.alpha = 0.709
+        else:              self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add_hash(self, h):
+        ''' adds an item by its 64-bit hash (see _hashes) '''
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, item):
+        self.add_hash(_hashes(item)[0])
+
+    def count(self):
+        estimate = self.alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * self.m:
+            # small range correction: linear counting
+            zeros = self.registers.count('\0')
+            if zeros:
+                estimate = self.m * math.log(float(self.m) / zeros)
+        return int(round(estimate))
+
+    def error(self):
+        ''' relative standard error of count() '''
+        return 1.04 / math.sqrt(self.m)
+
+
+def _add(tracker, key, host_hash, precision, **value):
+    ''' counts key in tracker (a HeavyHitters) and, once it's a candidate, the host it was seen
+        on. value is kept with the candidate, along with its hosts' HyperLogLog (hll), and whether
+        it's been a candidate since it was first seen (complete) '''
+    candidate = tracker.add(key)
+    if candidate is not None:
+        if candidate[1] is None:
+            candidate[1] = dict(value, hll=HyperLogLog(precision), complete=candidate[0] == 1)
+        candidate[1]['hll'].add_hash(host_hash)
+
+def summarize(all_crons, cronify, epsilon=0.0001, delta=0.01, precision=10, top=10):
+    ''' streams all_crons (an iterable of (host, {norm_cron: cron})) through fixed-size sketches.
+        cronify turns a puppet cron into its on-disk line. Returns a dict:
+          duplicated: [(estimate, lowest possible, distinct hosts, complete, cron line)], the most
+                      common crons, and how many hosts run them. complete is False if the cron was
+                      seen before it became a candidate, so distinct hosts may be too low.
+          commands:   [(estimate, lowest possible, distinct hosts, complete, command)], the same for
+                      commands
+          minutes:    [(crons, 'HH:MM')], the busiest minutes of a day (exact, ignoring days)
+          hosts, crons, and error: the sketches' sizes and error bounds '''
+
+    capacity = max(10 * top, 100)
+    duplicated = HeavyHitters(capacity, epsilon, delta)
+    commands   = HeavyHitters(capacity, epsilon, delta)
+    day        = array('L', [0]) * 1440
+    schedules  = {}     # puppet (minute, hour) -> minutes of the day; bounded, see below
+
+    hosts = 0
+    for host, crons in all_crons:
+        hosts += 1
+        host_hash = _hashes(host)[0]
+        for norm_cron, cron in crons.iteritems():
+            if norm_cron is None: continue
+
+            schedule = cronbalance.schedule_key(cron['parameters'])
+            _add(duplicated, '\t'.join(schedule + (norm_cron[5],)), host_hash, precision, line=cronify(cron))
+            _add(commands, norm_cron[5], host_hash, precision)
+
+            key = schedule[:2]
+            if key not in schedules:
+                if len(schedules) >= 10000: schedules.clear()
+                try:
+                    schedules[key] = cronbalance.day_minutes(dict(zip(('minute', 'hour'), key)))
+                except ValueError:
+                    schedules[key] = []
+            for minute in schedules[key]:
+                day[minute] += 1
+
+    dup_error = duplicated.sketch.error()
+    cmd_error = commands.sketch.error()
+    busiest = sorted(((count, minute) for minute, count in enumerate(day) if count),
+                     key=lambda (count, minute): (-count, minute))[:top]
+
+    return {
+        'hosts': hosts,
+        'crons': duplicated.sketch.total,
+        'duplicated': [(est, max(0, int(math.ceil(est - dup_error))), value['hll'].count(), value['complete'], value['line'])
+                       for est, key, value in duplicated.top(top)],
+        'commands': [(est, max(0, int(math.ceil(est - cmd_error))), value['hll'].count(), value['complete'], command)
+                     for est, command, value in commands.top(top)],
+        'minutes': [(count, '%02i:%02i' % divmod(minute, 60)) for count, minute in busiest],
+        'error': {'epsilon': epsilon, 'delta': delta,
+                  'width': duplicated.sketch.width, 'depth': duplicated.sketch.depth,
+                  'duplicated': dup_error, 'commands': cmd_error,
+                  'registers': 1 << precision, 'distinct': HyperLogLog(precision).error(),
+                  'candidates': 2 * capacity},
+    }
@@ -0,0 +1,189 @@
+### -*- coding: utf-8 -*-
+# renders when crons start, over a day or a week, as an svg timeline
+#
+# The period is split into width pixel-wide bins, and every cron start is counted in its bin,
+# so the size of the image, and the work per host, depend on the width rather than on how
+# often crons run. Each distinct schedule is expanded from the cron's puppet parameters
+# (cronbalance.schedule_minutes, so the timeline and --rebalance agree on when a cron starts)
+# and binned once, and reused by every cron on every host that has it.
+#
+# The fleet density strip is a bar chart of how many crons start in each bin, across all hosts.
+# With lanes, every host also gets a swimlane, shaded by how many of its crons start in each bin.
+# Lanes are written out as hosts are read, so the image is never held in memory; the height of
+# the svg is filled in once the last lane is written.
+#
+# Usage:
+'''
+import crontimeline
+timeline = crontimeline.Timeline(datetime.date(2012, 4, 2), days=7, width=1440)
+timeline.render(all_data, 'timeline.svg', lanes=True)
+'''
+
+import datetime
+import logging
+from xml.sax.saxutils import escape
+import cronbalance
+import cronmetrics
+
+# lane shading: (class, fewest starts in a bin), darkest last
+shades = (('s1', 1), ('s2', 2), ('s3', 4), ('s4', 8))
+
+style = '''
+text { font-family: sans-serif; font-size: 9px; fill: #333; }
+.title { font-size: 12px; }
+.grid { stroke: #bbb; stroke-width: 0.5; }
+.day { stroke: #666; stroke-width: 1; }
+.bar { fill: #c0392b; }
+.s1 { fill: #fde0c5; } .s2 { fill: #f8a46c; } .s3 { fill: #e3582c; } .s4 { fill: #8c1d0f; }
+'''
+
+# tick spacing candidates, in minutes
+ticks = (60, 180, 360, 720, 1440, 2880, 10080)
+
+
+class Timeline(object):
+    ''' bins cron starts over days days from local midnight of start (a datetime.date), into width bins '''
+
+    label_width  = 220
+    axis_height  = 40
+    lane_height  = 10
+    strip_height = 120
+
+    def __init__(self, start, days=7, width=1440):
+        self.start   = start
+        self.days    = days
+        self.width   = width
+        self.minutes = days * 1440
+        self._bins   = {}   # schedule -> [(bin, starts), ...]
+
+    def bins(self, schedule):
+        ''' returns [(bin, number of starts)] for schedule (a cronbalance.schedule_key), in bin order '''
+        if schedule not in self._bins:
+            try:
+                minutes = cronbalance.schedule_minutes(dict(zip(cronbalance.fields, schedule)), self.days, self.start)
+            except ValueError, e:
+                logging.warn("leaving a cron off the timeline: %s" % e)
+                minutes = []
+            counts = {}
+            for minute in minutes:
+                b = minute * self.width // self.minutes
+                counts[b] = counts.get(b, 0) + 1
+            self._bins[schedule] = sorted(counts.iteritems())
+            cronmetrics.incr('timeline_schedules')
+        return self._bins[schedule]
+
+    def _add(self, counts, schedules):
+        ''' adds the starts of {schedule: number of crons} to counts, a list of width ints '''
+        for schedule, n in schedules.iteritems():
+            for b, starts in self.bins(schedule):
+                counts[b] += starts * n
+
+    def _lane(self, host, counts, y):
+        ''' returns the svg for one host's swimlane: one path per shade, where each run of bins
+            with that shade is a relative "m dx 0 h width v height h -width z" box '''
+        runs = dict((name, []) for name, least in shades)
+        run_start, run_shade = 0, None
+        for b in xrange(self.width + 1):
+            shade = None
+            if b < self.width and counts[b]:
+                for name, least in shades:
+                    if counts[b] >= least: shade = name
+            if shade != run_shade:
+                if run_shade:
+                    runs[run_shade].append((run_start, b - run_start))
+                run_start, run_shade = b, shade
+
+        parts = ['<text x="4" y="%i">%s</text>' % (y + self.lane_height - 2, escape(host))]
+        h = self.lane_height - 1
+        for name, least in shades:
+            if not runs[name]: continue
+            d, x = ['M%i %i' % (self.label_width, y)], 0
+            for start, width in runs[name]:
+                d.append('m%i 0h%iv%ih-%iz' % (start - x, width, h, width))
+                x = start
+            parts.append('<path class="%s" d="%s"/>' % (name, ''.join(d)))
+        return '\n'.join(parts) + '\n'
+
+    def _strip(self, counts, hosts, crons, y):
+        ''' returns the svg for the fleet density strip: one bar per bin, scaled to the busiest bin '''
+        peak = max(counts) if counts else 0
+        per_bin = float(self.minutes) / self.width
+        parts = ['<text x="4" y="%i">%i hosts, %i crons</text>' % (y + 12, hosts, crons),
+                 '<text x="4" y="%i">peak: %i starts</text>' % (y + 24, peak),
+                 '<text x="4" y="%i">in %.3g minutes</text>' % (y + 36, per_bin)]
+        x0 = self.label_width
+        bottom = y + self.strip_height
+        for b, c in enumerate(counts):
+            if c:
+                h = max(1, c * self.strip_height // peak)
+                parts.append('<rect class="bar" x="%i" y="%i" width="1" height="%i"/>' % (x0 + b, bottom - h, h))
+        return '\n'.join(parts) + '\n'
+
+    def _axis(self, top, bottom):
+        ''' returns the svg for the time labels above top, and grid lines from top to bottom '''
+        for every in ticks:
+            if every * self.width >= 60 * self.minutes: break
+
+        parts = []
+        for minute in xrange(0, self.minutes + 1, every):
+            x = self.label_width + minute * self.width // self.minutes
+            when = datetime.datetime.combine(self.start, datetime.time()) + datetime.timedelta(minutes=minute)
+            if minute % 1440 == 0:
+                label, line = when.strftime('%a %m-%d'), 'day'
+            else:
+                label, line = when.strftime('%H:%M'), 'grid'
+            parts.append('<line class="%s" x1="%i" y1="%i" x2="%i" y2="%i"/>' % (line, x, top - 4, x, bottom))
+            if minute < self.minutes:
+                parts.append('<text x="%i" y="%i">%s</text>' % (x + 2, top - 6, label))
+        return '\n'.join(parts) + '\n'
+
+    def render(self, all_crons, filename, lanes=False):
+        ''' writes the timeline of all_crons (an iterable of (host, {norm_cron: cron})) to filename.
+            With lanes, each host gets a swimlane above the fleet density strip. '''
+
+        FILE = open(filename, 'w')
+        total_width = self.label_width + self.width + 10
+        FILE.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        FILE.write('<svg xmlns="http://www.w3.org/2000/svg" width="%i" height="' % total_width)
+        height_at = FILE.tell()
+        FILE.write('%010i">\n' % 0)
+        FILE.write('<style>%s</style>\n' % style)
+        FILE.write('<rect x="0" y="0" width="%i" height="100%%" fill="white"/>\n' % total_width)
+
+        end = self.start + datetime.timedelta(days=self.days)
+        FILE.write('<text class="title" x="4" y="14">cron starts, %s to %s</text>\n' % (self.start, end))
+
+        fleet = {}          # schedule -> number of crons, across all hosts
+        hosts, crons = 0, 0
+        y = self.axis_height
+        for host, host_crons in all_crons:
+            schedules = {}
+            for norm_cron, cron in host_crons.iteritems():
+                if norm_cron is None: continue      # a cron line cronlib couldn't normalize
+                schedule = cronbalance.schedule_key(cron['parameters'])
+                schedules[schedule] = schedules.get(schedule, 0) + 1
+            for schedule, n in schedules.iteritems():
+                fleet[schedule] = fleet.get(schedule, 0) + n
+            hosts += 1
+            crons += len(host_crons)
+            cronmetrics.incr('timeline_hosts')
+
+            if lanes:
+                counts = [0] * self.width
+                self._add(counts, schedules)
+                FILE.write(self._lane(host, counts, y))
+                y += self.lane_height
+
+        counts = [0] * self.width
+        self._add(counts, fleet)
+        if lanes: y += 10
+        FILE.write(self._strip(counts, hosts, crons, y))
+        y += self.strip_height
+
+        FILE.write(self._axis(self.axis_height, y))
+        FILE.write('</svg>\n')
+
+        # now that the height is known, fill it in
+        FILE.seek(height_at)
+        FILE.write('%010i' % (y + 10))
+        FILE.close()
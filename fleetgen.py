@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+#
+# Generates a synthetic fleet of puppet catalogs, for load-testing the whole pipeline
+# without a puppet master.
+#
+# Catalogs look like `puppet master --compile` output: json, with the colored notice/warning
+# lines puppet prints before it (cron-parse.py strips those). Every host gets a random number
+# of crons, drawn from a mix of schedule kinds, with some duplicated on the same host and
+# some set to ensure => absent. Commands are drawn from a small pool, so the same cron shows
+# up on many hosts. A host's catalog only depends on --seed and its name.
+#
+# usage: fleetgen.py [options]
+#
+#   ./fleetgen.py -n 10000                  (writes ./catalogs/, ready for cron-parse.py)
+#   ./fleetgen.py -n 10000 -a               (writes ./catalogs.pca, for cron-parse.py -a)
+#
+# To exercise puppet.py too, write a stub puppet command, and point puppet.py at it:
+#
+#   ./fleetgen.py -n 500 --stub-puppet ./stub
+#   ./puppet.py --puppet-command ./stub/puppet
+#
+# Or, to exercise puppetdb.py, serve the same fleet's crons like PuppetDB does:
+#
+#   ./fleetgen.py -n 500 --serve-puppetdb 8080 &
+#   ./puppetdb.py --url http://localhost:8080
+#
+import sys
+import os
+import stat
+import random
+import hashlib
+import logging
+import simplejson as json
+from optparse import OptionParser
+import cronarchive
+
+# schedule generators, by kind. each takes a random.Random and returns the 5 time fields.
+schedule_kinds = {
+    'hourly':   lambda r: (str(r.randrange(60)), '*', '*', '*', '*'),
+    'daily':    lambda r: (str(r.randrange(60)), str(r.randrange(24)), '*', '*', '*'),
+    'step':     lambda r: ('*/%i' % r.choice((2, 5, 10, 15, 30)), '*', '*', '*', '*'),
+    'weekly':   lambda r: (str(r.randrange(60)), str(r.randrange(24)), '*', '*', r.choice(('0', '1-5', 'Mon,Wed'))),
+    'monthly':  lambda r: (str(r.randrange(60)), str(r.randrange(24)), str(r.randrange(1, 29)), '*', '*'),
+    'range':    lambda r: ('0,30', r.choice(('9-17', '*/2', '0-6')), '*', '*', r.choice(('*', '1-5'))),
+}
+
+default_mix = "hourly=4,daily=3,step=2,weekly=1,monthly=1,range=1"
+
+commands = ('/usr/local/bin/backup.sh', 'run-parts /etc/cron.hourly', 'mysqldump -A | gzip > /backup/db.gz',
+            'nodetool repair', '/usr/bin/logrotate /etc/logrotate.conf', 'puppet agent --onetime',
+            'find /tmp -mtime +7 -delete', 'hadoop jar /opt/jobs/rollup.jar')
+
+modules = ('base', 'backup', 'mysql', 'cassandra', 'hadoop', 'logging')
+
+
+def parse_mix(mix):
+    ''' parses 'hourly=4,daily=3' into a list of kinds, repeated by weight. Raises ValueError for unknown kinds. '''
+    kinds = []
+    for pair in mix.split(','):
+        kind, weight = pair.split('=')
+        if kind not in schedule_kinds:
+            raise ValueError("unknown schedule kind '%s', use: %s" % (kind, ', '.join(sorted(schedule_kinds))))
+        kinds += [kind] * int(weight)
+    return kinds
+
+def host_crons(r, count, kinds, dup_ratio=0.0, absent_ratio=0.0):
+    ''' returns a list of count puppet cron resources, using random.Random r '''
+    crons = []
+    for c in xrange(count):
+        if crons and r.random() < dup_ratio:
+            # the same cron again, under another title
+            cron = dict(r.choice(crons))
+            cron['title'] = 'cron-%i' % c
+            crons.append(cron)
+            continue
+
+        module = r.choice(modules)
+        minute, hour, monthday, month, weekday = schedule_kinds[r.choice(kinds)](r)
+        params = {'minute': minute, 'hour': hour, 'monthday': monthday, 'month': month, 'weekday': weekday,
+                  'command': "%s --job %i" % (r.choice(commands), r.randrange(count)), 'user': 'root'}
+        if r.random() < absent_ratio:
+            params['ensure'] = 'absent'
+
+        crons.append({'type': 'Cron', 'title': 'cron-%i' % c, 'exported': False,
+                      'tags': ['cron', module, 'cron-%i' % c, 'class'],
+                      'file': '/etc/puppet/modules/%s/manifests/init.pp' % module, 'line': r.randrange(1, 200),
+                      'parameters': params})
+    return crons
+
+def host_names(hosts):
+    return ['host%05i.example.com' % h for h in xrange(hosts)]
+
+def host_resources(r, crons, kinds, dup_ratio=0.0, absent_ratio=0.0):
+    ''' returns all the resources in a host's catalog, using random.Random r '''
+    resources = [{'type': 'Class', 'title': 'Main', 'tags': ['class'], 'exported': False, 'parameters': {}}]
+    for module in r.sample(modules, 3):
+        resources.append({'type': 'Package', 'title': module, 'tags': ['package', module], 'exported': False,
+                          'file': '/etc/puppet/modules/%s/manifests/init.pp' % module, 'line': 3,
+                          'parameters': {'ensure': 'installed'}})
+    resources += host_crons(r, r.randint(crons // 2, crons + crons // 2), kinds, dup_ratio, absent_ratio)
+    return resources
+
+def catalog(host, crons, kinds, seed, dup_ratio=0.0, absent_ratio=0.0):
+    ''' returns the `puppet master --compile` output for host: notice lines, then the json catalog '''
+    r = random.Random("%s:%s" % (seed, host))
+
+    resources = host_resources(r, crons, kinds, dup_ratio, absent_ratio)
+
+    document = {'document_type': 'Catalog', 'metadata': {'api_version': 1},
+                'data': {'name': host, 'version': 1334000000, 'tags': ['settings', 'class'],
+                         'classes': ['settings'], 'resources': resources,
+                         'edges': [{'source': 'Class[Main]', 'target': '%s[%s]' % (res['type'], res['title'])}
+                                   for res in resources[1:]]}}
+
+    noise = ''
+    if r.random() < 0.2:
+        noise += "\x1b[0;33mwarning: Could not retrieve fact fqdn\x1b[0m\n"
+    noise += "\x1b[0;36mnotice: Compiled catalog for %s in environment production in %.2f seconds\x1b[0m\n" % (
+        host, r.uniform(0.1, 3))
+
+    return noise + json.dumps(document) + '\n'
+
+def write_stub(stubdir, argv):
+    ''' writes an executable stub 'puppet' command to stubdir, which answers `puppet cert list --all`
+        and `puppet master --compile <node>` from this generator, with the same options '''
+    if not os.path.exists(stubdir): os.makedirs(stubdir)
+    path = os.path.join(stubdir, 'puppet')
+    script = "#!/bin/sh\nexec %s %s %s --puppet-stub -- \"$@\"\n" % (
+        sys.executable, os.path.abspath(__file__), ' '.join("'%s'" % a for a in argv))
+    open(path, 'w').write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+def puppetdb_resources(hosts, crons, kinds, seed, dup_ratio=0.0, absent_ratio=0.0):
+    ''' returns the Cron resources of the fleet as PuppetDB's /resources endpoint does, ordered by
+        certname and title. They're the same crons catalog() generates. '''
+    found = []
+    for host in host_names(hosts):
+        r = random.Random("%s:%s" % (seed, host))
+        for res in host_resources(r, crons, kinds, dup_ratio, absent_ratio):
+            if res['type'] != 'Cron': continue
+            found.append({'certname': host, 'resource': hashlib.sha1(host + res['title']).hexdigest(),
+                          'type': 'Cron', 'title': res['title'], 'tags': res['tags'], 'exported': False,
+                          'file': res['file'], 'line': res['line'], 'environment': 'production',
+                          'parameters': res['parameters']})
+    found.sort(key=lambda res: (res['certname'], res['title']))
+    return found
+
+def serve_puppetdb(port, resources, api='/pdb/query/v4'):
+    ''' answers GET api/resources/Cron with resources, on localhost:port, until interrupted. Supports
+        limit, offset and a ["=", "certname", ...] query, which is all puppetdb.py uses. '''
+    import BaseHTTPServer
+    import SocketServer
+    import urlparse
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'       # keep-alive
+
+        def do_GET(self):
+            url = urlparse.urlparse(self.path)
+            params = dict(urlparse.parse_qsl(url.query))
+            if url.path != api + '/resources/Cron':
+                return self.answer(404, {'error': 'not found: %s' % url.path})
+
+            found = resources
+            if 'query' in params:
+                query = json.loads(params['query'])
+                if query[:2] != ['=', 'certname']:
+                    return self.answer(400, {'error': 'unsupported query: %s' % params['query']})
+                found = [res for res in found if res['certname'] == query[2]]
+
+            offset = int(params.get('offset', 0))
+            if 'limit' in params: found = found[offset:offset + int(params['limit'])]
+            else:                 found = found[offset:]
+            self.answer(200, found)
+
+        def answer(self, status, obj):
+            body = json.dumps(obj)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+
+    server = Server(('localhost', port), Handler)
+    logging.info("serving %i crons as PuppetDB on http://localhost:%i%s" % (len(resources), port, api))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("-d", "--debug", default=None, action="store_true", help="enable debug output")
+    parser.add_option("-n", "--hosts", default=100, type="int", help="number of hosts (default: %default)")
+    parser.add_option("-c", "--crons", default=20, type="int",
+            help="average crons per host, the actual number is +/- 50%% (default: %default)")
+    parser.add_option("--mix", default=default_mix,
+            help="schedule mix, as kind=weight pairs. kinds: %s (default: %%default)" % ', '.join(sorted(schedule_kinds)))
+    parser.add_option("--dup-ratio", default=0.05, type="float",
+            help="fraction of crons that duplicate another cron on the same host (default: %default)")
+    parser.add_option("--absent-ratio", default=0.1, type="float",
+            help="fraction of crons with ensure => absent (default: %default)")
+    parser.add_option("--seed", default=42, type="int", help="random seed (default: %default)")
+    parser.add_option("-a", "--archive", default=None, action="store_true",
+            help="write ./catalogs.pca instead of ./catalogs/ (see cron-parse.py -a)")
+    parser.add_option("--stub-puppet", default=None, metavar="DIR",
+            help="don't generate catalogs, write a stub 'puppet' command for puppet.py --puppet-command to DIR")
+    parser.add_option("--puppet-stub", default=None, action="store_true",
+            help="act as the stub puppet command (used by --stub-puppet)")
+    parser.add_option("--serve-puppetdb", default=None, type="int", metavar="PORT",
+            help="don't write catalogs, serve the fleet's crons like PuppetDB on localhost:PORT, for puppetdb.py")
+    (options, args) = parser.parse_args()
+
+    if options.debug: log_level = logging.DEBUG
+    else:             log_level = logging.INFO
+
+    logging.basicConfig(stream=sys.stderr, level=log_level)
+
+    try:
+        kinds = parse_mix(options.mix)
+    except ValueError, e:
+        parser.error(str(e))
+
+    outdir = './catalogs/'
+    archive_path = './catalogs.pca'
+
+    if options.puppet_stub:
+        # puppet cert list --all, and puppet master --compile <node>
+        if args[:2] == ['cert', 'list']:
+            for host in host_names(options.hosts):
+                print "+ %s (AA:BB:CC:DD:EE:FF:00:11:22:33:44:55:66:77:88:99)" % host
+        elif args[:2] == ['master', '--compile'] and len(args) == 3:
+            sys.stdout.write(catalog(args[2], options.crons, kinds, options.seed,
+                                     options.dup_ratio, options.absent_ratio))
+        else:
+            sys.stderr.write("stub puppet: don't know how to '%s'\n" % ' '.join(args))
+            sys.exit(1)
+        sys.exit(0)
+
+    if options.stub_puppet:
+        argv = ['-n', options.hosts, '-c', options.crons, '--mix', options.mix, '--seed', options.seed,
+                '--dup-ratio', options.dup_ratio, '--absent-ratio', options.absent_ratio]
+        logging.info("wrote %s" % write_stub(options.stub_puppet, argv))
+        sys.exit(0)
+
+    if options.serve_puppetdb:
+        serve_puppetdb(options.serve_puppetdb, puppetdb_resources(options.hosts, options.crons, kinds, options.seed,
+                                                                  options.dup_ratio, options.absent_ratio))
+        sys.exit(0)
+
+    if options.archive:
+        archive = cronarchive.Archive(archive_path, 'w')
+    elif not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    for host in host_names(options.hosts):
+        if options.debug: logging.debug("generating catalog for: %s" % host)
+        data = catalog(host, options.crons, kinds, options.seed, options.dup_ratio, options.absent_ratio)
+
+        if options.archive:
+            archive.write(host, data)
+        else:
+            FILE = open(outdir + host, 'w')
+            FILE.write(data)
+            FILE.close()
+
+    if options.archive:
+        archive.close()
+
+    logging.info("generated %i catalogs" % options.hosts)
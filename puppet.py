@@ -14,10 +14,20 @@ import os
 import subprocess
 import logging
 from optparse import OptionParser
+import cronarchive
+import cronmetrics
 
 parser = OptionParser("usage: %prog [options]")
 parser.add_option("-d", "--debug", default=None, action="store_true", help="enable debug output")
 parser.add_option("--dest", default=None, help="write to a file")
+parser.add_option("--puppet-command", default="sudo puppet",
+        help="command used to run puppet (default: %default). See fleetgen.py --stub-puppet for testing")
+parser.add_option("-a", "--archive", default=None, action="store_true",
+        help="write all catalogs to a single archive, ./catalogs.pca, instead of ./catalogs/")
+parser.add_option("--profile", default=None, action="store_true",
+        help="profile the run with cProfile, print sorted stats to stderr and save them to ./metrics/")
+parser.add_option("--metrics", default=None, metavar="FILE",
+        help="write timings and counters as json to FILE (with just --profile: ./metrics/puppet.json)")
 (options, args) = parser.parse_args()
 
 # set up logging
@@ -27,9 +37,12 @@ else:             log_level = logging.INFO
 logging.basicConfig(stream=sys.stdout, level=log_level)
 logging.basicConfig(stream=sys.stderr, level=(logging.ERROR,logging.CRITICAL))
 
+cronmetrics.setup('puppet', profile=options.profile, metrics_file=options.metrics)
+
 
 if __name__ == '__main__':
     outdir = './catalogs/'
+    archive_path = './catalogs.pca'
 
     if len(args) > 0:
         parser.error("this script doesn't take arguments, what are you trying to do?")
@@ -37,35 +50,53 @@ if __name__ == '__main__':
     ''' First, gather a list of signed agents using puppet cert '''
 
     # --all lists all puppet certs, with a '+' starting the line for signed certs.
-    cert_command = "sudo puppet cert list --all |grep '^\+' |awk '{print $2}'"
+    cert_command = options.puppet_command + " cert list --all |grep '^\+' |awk '{print $2}'"
 
     if options.debug: logging.debug("getting a list of all certs...")
 
-    process = subprocess.Popen(cert_command, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-    stdout, stderr = process.communicate()
+    with cronmetrics.timer('cert_list'):
+        process = subprocess.Popen(cert_command, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        stdout, stderr = process.communicate()
 
     if stderr or not stdout:
         logging.error("failed to get puppet catalogs. command output was: %s" % stderr)
 
     ''' Next, ask the puppet master to compile its catalogs and provide json, and write each file out '''
 
-    compile_command = "sudo puppet master --compile "
+    compile_command = options.puppet_command + " master --compile "
+
+    if options.archive:
+        archive = cronarchive.Archive(archive_path, 'w')
 
     for node in stdout.split():
         if options.debug: logging.debug("compiling catalog for: %s" % node)
 
-        process = subprocess.Popen(compile_command + node, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        with cronmetrics.timer('compile'):
+            process = subprocess.Popen(compile_command + node, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+            stdout, stderr = process.communicate()
 
         if stderr or not stdout:
             logging.error("failed to get catalog for node: %s; output was: %s" % (node, stderr))
-        else:
-            if not os.path.exists(outdir): os.makedirs(outdir)
-            if options.debug: logging.debug("writing file for: %s" % node)
-
-            FILE = open(outdir + node, 'w')
-            FILE.writelines(stdout)
-            FILE.close()
+            cronmetrics.incr('failed_hosts')
+            continue
+
+        cronmetrics.incr('hosts')
+        cronmetrics.incr('bytes_written', len(stdout))
+
+        with cronmetrics.timer('write'):
+            if options.archive:
+                if options.debug: logging.debug("archiving catalog for: %s" % node)
+                archive.write(node, stdout)
+            else:
+                if not os.path.exists(outdir): os.makedirs(outdir)
+                if options.debug: logging.debug("writing file for: %s" % node)
+
+                FILE = open(outdir + node, 'w')
+                FILE.writelines(stdout)
+                FILE.close()
+
+    if options.archive:
+        archive.close()
 
 
 
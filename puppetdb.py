@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+#
+# Script to fetch the cron resources of all nodes from PuppetDB, and write them to
+# ./parse-output/ in the format cron-parse.py writes, ready for cron-analyze.py.
+#
+# This replaces both puppet.py and cron-parse.py: nothing is compiled, it doesn't need to
+# run on the puppet master or as root, and PuppetDB only sends Cron resources. Results are
+# paged (ordered by certname), fetched --concurrency pages at a time over a pool of keep-alive
+# connections, and each node is written out as soon as all of its crons have arrived.
+#
+# Nodes without any crons don't get a file.
+#
+# usage: puppetdb.py [options]
+#
+#   ./puppetdb.py --url http://puppetdb.example.com:8080
+#   ./puppetdb.py --url https://puppetdb.example.com:8081 --cert agent.pem --key agent.key -a -c
+#
+# For testing, fleetgen.py --serve-puppetdb serves a synthetic fleet the same way.
+#
+import sys
+import os
+import socket
+import urllib
+import httplib
+import urlparse
+import threading
+import logging
+import Queue
+import simplejson as json
+from optparse import OptionParser
+import cronarchive
+import cronmetrics
+from cronanalyzer.loader import format_crons
+
+parser = OptionParser("usage: %prog [options]")
+parser.add_option("-d", "--debug", default=None, action="store_true", help="enable debug output")
+parser.add_option("--url", default="http://localhost:8080", help="PuppetDB base url (default: %default)")
+parser.add_option("--api", default="/pdb/query/v4", help="PuppetDB query api path (default: %default)")
+parser.add_option("--cert", default=None, help="client certificate, for https")
+parser.add_option("--key", default=None, help="client certificate key, for https")
+parser.add_option("--host", default=None, help="only fetch crons for this node (puppet certname)")
+parser.add_option("-j", "--concurrency", default=4, type="int",
+        help="pages to fetch at once, and connections to keep open (default: %default)")
+parser.add_option("--page-size", default=5000, type="int", help="resources per request (default: %default)")
+parser.add_option("--timeout", default=60, type="int", help="seconds to wait for each request (default: %default)")
+parser.add_option("-c", "--compact", default=False, action="store_true",
+        help="write compact binary records instead of json (see cron-parse.py --compact)")
+parser.add_option("-a", "--archive", default=False, action="store_true",
+        help="write ./parse-output.pca, instead of one file per host (see cron-parse.py --archive)")
+parser.add_option("--profile", default=None, action="store_true",
+        help="profile the run with cProfile, print sorted stats to stderr and save them to ./metrics/")
+parser.add_option("--metrics", default=None, metavar="FILE",
+        help="write timings and counters as json to FILE (with just --profile: ./metrics/puppetdb.json)")
+(options, args) = parser.parse_args()
+
+# set up logging
+if options.debug: log_level = logging.DEBUG
+else:             log_level = logging.INFO
+
+logging.basicConfig(stream=sys.stdout, level=log_level)
+logging.basicConfig(stream=sys.stderr, level=(logging.ERROR,logging.CRITICAL))
+
+cronmetrics.setup('puppetdb', profile=options.profile, metrics_file=options.metrics)
+
+
+class ConnectionPool(object):
+    ''' up to size keep-alive connections to one http(s) server, shared between threads '''
+
+    def __init__(self, url, size, timeout=60, cert=None, key=None):
+        url = urlparse.urlparse(url)
+        self.https   = url.scheme == 'https'
+        self.netloc  = url.netloc
+        self.timeout = timeout
+        self.cert    = cert
+        self.key     = key
+        self.idle    = Queue.Queue()
+        for i in xrange(size):
+            self.idle.put(None)     # connections are opened when first needed
+
+    def _connect(self):
+        if self.https:
+            return httplib.HTTPSConnection(self.netloc, timeout=self.timeout, key_file=self.key, cert_file=self.cert)
+        return httplib.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def get(self, path):
+        ''' returns the body of GET path. Retries once on a fresh connection, in case the server
+            closed an idle one. Raises IOError if the server doesn't answer 200. '''
+        conn = self.idle.get()
+        try:
+            for attempt in (1, 2):
+                if conn is None: conn = self._connect()
+                try:
+                    conn.request('GET', path, headers={'Accept': 'application/json', 'Connection': 'keep-alive'})
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except (httplib.HTTPException, socket.error), e:
+                    conn.close()
+                    conn = None
+                    if attempt == 2: raise IOError("GET %s failed: %s" % (path, e))
+
+            if response.status != 200:
+                raise IOError("GET %s failed: %s %s: %s" % (path, response.status, response.reason, body[:200]))
+            if response.getheader('connection', '').lower() == 'close':
+                conn.close()
+                conn = None
+            return body
+        finally:
+            self.idle.put(conn)
+
+
+def page_path(offset, limit):
+    ''' the query for one page of Cron resources, ordered by certname so each node's crons are together '''
+    params = {'order_by': json.dumps([{'field': 'certname'}, {'field': 'title'}]),
+              'limit':    limit,
+              'offset':   offset}
+    if options.host:
+        params['query'] = json.dumps(['=', 'certname', options.host])
+    return "%s/resources/Cron?%s" % (options.api.rstrip('/'), urllib.urlencode(params))
+
+def fetch_pages(pool, page_size, concurrency):
+    ''' generator: yields pages of Cron resources in order. Fetches concurrency pages at a time,
+        and stops after the first short page. '''
+    offset = 0
+    while True:
+        offsets = [offset + i * page_size for i in xrange(concurrency)]
+        results = {}
+
+        def fetch(o):
+            try:
+                with cronmetrics.timer('fetch'):
+                    results[o] = pool.get(page_path(o, page_size))
+            except Exception, e:
+                results[o] = e
+
+        threads = [threading.Thread(target=fetch, args=(o,)) for o in offsets]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        for o in offsets:
+            if isinstance(results[o], Exception):
+                raise results[o]
+            cronmetrics.incr('pages')
+            cronmetrics.incr('bytes_read', len(results[o]))
+            with cronmetrics.timer('json_load'):
+                page = json.loads(results[o])
+            results[o] = None
+            yield page
+            if len(page) < page_size:
+                return
+        offset += concurrency * page_size
+
+def iter_nodes(pages):
+    ''' generator: groups a stream of pages of Cron resources, ordered by certname, into (certname, crons) '''
+    certname, crons = None, []
+    for page in pages:
+        for resource in page:
+            if resource['certname'] != certname:
+                if crons: yield certname, crons
+                certname, crons = resource['certname'], []
+            crons.append(resource)
+    if crons: yield certname, crons
+
+
+if __name__ == '__main__':
+    outdir = './parse-output/'
+
+    if len(args) > 0:
+        parser.error("this script doesn't take arguments, what are you trying to do?")
+    if options.concurrency < 1 or options.page_size < 1:
+        parser.error("--concurrency and --page-size must be at least 1")
+
+    if options.archive:
+        output = cronarchive.Archive(outdir.rstrip('/') + '.pca', 'w')
+    elif not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    pool = ConnectionPool(options.url, options.concurrency, options.timeout, options.cert, options.key)
+
+    try:
+        for certname, crons in iter_nodes(fetch_pages(pool, options.page_size, options.concurrency)):
+            if options.debug: logging.debug("writing %i crons for: %s" % (len(crons), certname))
+            cronmetrics.incr('hosts')
+            cronmetrics.incr('crons', len(crons))
+
+            data = format_crons(certname, crons, options.compact)
+            with cronmetrics.timer('write'):
+                if options.archive:
+                    output.write(certname, data)
+                else:
+                    FILE = open(outdir + certname, 'wb')
+                    FILE.write(data)
+                    FILE.close()
+    except (IOError, ValueError, httplib.HTTPException), e:
+        logging.error("failed to fetch crons from %s: %s" % (options.url, e))
+        sys.exit(1)
+    finally:
+        if options.archive: output.close()
+
+    logging.info("fetched crons for %i hosts from %s" % (cronmetrics.counters.get('hosts', 0), options.url))